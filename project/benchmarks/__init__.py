@@ -0,0 +1 @@
+"""Нагрузочные тесты сервера. Запуск из каталога project: python -m benchmarks.<модуль>"""
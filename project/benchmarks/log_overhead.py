@@ -0,0 +1,83 @@
+"""
+Микротест накладных расходов декоратора @log.
+
+Сравнивает вызов функции без декоратора, с прежним декоратором (обход
+стека traceback.format_stack и f-строка на каждый вызов) и с текущим
+logs.decos.log при выключенной и включённой трассировке. Записи уходят
+в NullHandler, так что измеряется только стоимость декоратора.
+
+    python -m benchmarks.log_overhead --calls 100000
+"""
+import argparse
+import json
+import logging
+import sys
+import timeit
+import traceback
+
+from logs.decos import TRACE_LOGGER, log, set_tracing
+
+LEGACY_LOGGER = logging.getLogger('bench_legacy')
+
+
+def legacy_log(func_to_log):
+    """Декоратор в прежнем виде, для сравнения."""
+
+    def wrap(*args, **kwargs):
+        res = func_to_log(*args, **kwargs)
+        trace = traceback.format_stack()
+        LEGACY_LOGGER.debug(f' Вызвана функция {func_to_log.__name__} c аргументами {args}, {kwargs}'
+                            f' из модуля {func_to_log.__module__}.'
+                            f' Вызов из функции {trace[0].split()[-1]}')
+        return res
+
+    return wrap
+
+
+def target(client, msg):
+    return msg
+
+
+def per_call(func, calls, depth):
+    """Время одного вызова в наносекундах на глубине стека depth."""
+    message = {'action': 'msg', 'time': 1.1, 'from': 'test1', 'to': 'test2', 'message': 'x' * 64}
+
+    def nested(level):
+        if level:
+            return nested(level - 1)
+        return min(timeit.repeat(lambda: func('sock', message), number=calls, repeat=5))
+
+    return round(nested(depth) / calls * 1e9, 1)
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description='Накладные расходы декоратора @log')
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--depth', type=int, default=20, help='глубина стека в месте вызова')
+    return parser.parse_args()
+
+
+def main():
+    args = get_params()
+    for logger in (LEGACY_LOGGER, TRACE_LOGGER):
+        logger.propagate = False
+        logger.addHandler(logging.NullHandler())
+    legacy = legacy_log(target)
+    traced = log(target)
+    results = {'calls': args.calls, 'depth': args.depth, 'ns_per_call': {}}
+    timings = results['ns_per_call']
+    timings['plain'] = per_call(target, args.calls, args.depth)
+    LEGACY_LOGGER.setLevel(logging.INFO)
+    timings['legacy_disabled'] = per_call(legacy, args.calls, args.depth)
+    LEGACY_LOGGER.setLevel(logging.DEBUG)
+    timings['legacy_enabled'] = per_call(legacy, args.calls, args.depth)
+    set_tracing(False)
+    timings['log_disabled'] = per_call(traced, args.calls, args.depth)
+    set_tracing(True)
+    timings['log_enabled'] = per_call(traced, args.calls, args.depth)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+Нагрузочный тест пересылки сообщений.
+
+Сервер (server.core.Server или AsyncServer) запускается без GUI в отдельном
+процессе на временной базе SQLite, в которой заранее регистрируются
+пользователи. Синтетические клиенты в одном потоке на selectors проходят
+presence + HMAC авторизацию, затем каждый держит window неподтверждённых
+сообщений следующему по кругу клиенту.
+
+Результат - JSON: входы в секунду, доставленные сообщения в секунду и
+задержка доставки p50/p99 (от отправки до получения адресатом).
+
+    python -m benchmarks.relay --clients 50 --duration 5 --core both
+"""
+import argparse
+import binascii
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import selectors
+import socket
+import struct
+import tempfile
+import time
+
+from Cryptodome.PublicKey import RSA
+
+from constants import *
+from utils import MessageFramer, AVAILABLE_CODECS
+
+SEQUENCE = struct.Struct('>Q')
+PASSWORD = '123'
+# Сервер принимает только разбираемый публичный ключ; один на всех клиентов.
+BENCH_KEY = RSA.generate(1024).publickey().export_key().decode('ascii')
+CORES = {'selectors': 'Server', 'asyncio': 'AsyncServer'}
+
+
+def password_hash(name, password=PASSWORD):
+    """Хэш пароля так же, как его считает клиент."""
+    passwd_hash = hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'),
+                                      name.lower().encode('utf-8'), 10000)
+    return binascii.hexlify(passwd_hash)
+
+
+def wait_listening(port, timeout):
+    """Дождаться, пока сервер начнёт принимать подключения."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise TimeoutError('Сервер не запустился')
+            time.sleep(0.05)
+
+
+def serve(core, port, db_path, users, ready, stop, quiet):
+    """Процесс сервера: регистрация пользователей и работа до сигнала stop."""
+    import logging
+    import server.core
+    from server.server_database import ServerDB
+
+    if quiet:
+        logging.getLogger('server').setLevel(logging.WARNING)
+    database = ServerDB(db_path)
+    for name in users:
+        database.add_user(name, password_hash(name))
+    server_class = getattr(server.core, CORES[core])
+    relay = server_class('127.0.0.1', port, database)
+    relay.daemon = True
+    relay.start()
+    ready.set()
+    stop.wait()
+    relay.shutdown()
+    database.close()
+
+
+class BenchClient:
+    """Синтетический клиент: неблокирующий сокет и сборщик кадров."""
+
+    def __init__(self, name, passwd_hash, codecs):
+        self.name = name
+        self.passwd_hash = passwd_hash
+        self.codecs = codecs
+        self.framer = MessageFramer()
+        self.outbound = bytearray()
+        self.sock = None
+        self.logged_in = False
+        self.in_flight = 0
+        self.peer = None
+
+    def send(self, message):
+        self.outbound += self.framer.pack(message)
+        self.flush()
+
+    def flush(self):
+        while self.outbound:
+            try:
+                sent = self.sock.send(self.outbound)
+            except (BlockingIOError, InterruptedError):
+                return
+            del self.outbound[:sent]
+
+    def presence(self):
+        message = {ACTION: PRESENCE, TIME: time.time(),
+                   USER: {ACCOUNT_NAME: self.name, PUBLIC_KEY: BENCH_KEY}}
+        if self.codecs:
+            message[CODECS] = self.codecs
+        self.send(message)
+
+
+class Bench:
+    """Драйвер синтетических клиентов."""
+
+    def __init__(self, port, names, window, payload, codecs):
+        self.selector = selectors.DefaultSelector()
+        self.port = port
+        self.window = window
+        self.payload = os.urandom(max(payload, SEQUENCE.size) - SEQUENCE.size)
+        self.clients = [BenchClient(name, password_hash(name), codecs) for name in names]
+        for number, client in enumerate(self.clients):
+            client.peer = self.clients[(number + 1) % len(self.clients)].name
+        self.sent_at = {}
+        self.latencies = []
+        self.sequence = 0
+        self.sending = False
+        self.errors = 0
+
+    def connect(self):
+        for client in self.clients:
+            client.sock = socket.create_connection(('127.0.0.1', self.port))
+            client.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client.sock.setblocking(False)
+            self.selector.register(client.sock, selectors.EVENT_READ, client)
+
+    def poll(self, timeout):
+        for key, mask in self.selector.select(timeout):
+            client = key.data
+            client.flush()
+            try:
+                data = client.sock.recv(RECV_BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                continue
+            if not data:
+                raise ConnectionResetError(f'Сервер закрыл соединение {client.name}')
+            client.framer.feed(data)
+            while client.framer.pending:
+                self.handle(client, client.framer.pop())
+
+    def handle(self, client, message):
+        if ACTION in message and message[ACTION] == MESSAGE:
+            text = message[MESSAGE_TEXT]
+            sequence, = SEQUENCE.unpack_from(text if isinstance(text, bytes) else binascii.a2b_base64(text))
+            self.latencies.append(time.perf_counter() - self.sent_at.pop(sequence))
+        elif message.get(RESPONSE) == 511:
+            digest = hmac.new(client.passwd_hash, message[ALERT].encode('utf-8'), 'MD5').digest()
+            client.send({RESPONSE: 511, ALERT: binascii.b2a_base64(digest).decode('ascii')})
+        elif message.get(RESPONSE) == 200 and not client.logged_in:
+            client.logged_in = True
+            if CODEC in message:
+                client.framer.codec = AVAILABLE_CODECS[message[CODEC]]
+        elif message.get(RESPONSE) == 200:
+            client.in_flight -= 1
+            self.fill(client)
+        else:
+            self.errors += 1
+
+    def fill(self, client):
+        """Дослать сообщения, пока в пути меньше window."""
+        while self.sending and client.in_flight < self.window:
+            self.sequence += 1
+            self.sent_at[self.sequence] = time.perf_counter()
+            client.in_flight += 1
+            client.send({ACTION: MESSAGE, TIME: time.time(), FROM: client.name, TO: client.peer,
+                         MESSAGE_TEXT: SEQUENCE.pack(self.sequence) + self.payload})
+
+    def login(self, timeout):
+        """Авторизовать всех клиентов одновременно, вернуть затраченное время."""
+        start = time.perf_counter()
+        self.connect()
+        for client in self.clients:
+            client.presence()
+        deadline = start + timeout
+        while not all(client.logged_in for client in self.clients):
+            if time.perf_counter() > deadline:
+                raise TimeoutError('Не все клиенты авторизовались')
+            self.poll(0.1)
+        return time.perf_counter() - start
+
+    def relay(self, duration, drain_timeout):
+        """Поток сообщений в течение duration секунд, затем дождаться доставки."""
+        start = time.perf_counter()
+        self.sending = True
+        for client in self.clients:
+            self.fill(client)
+        while time.perf_counter() - start < duration:
+            self.poll(0.1)
+        self.sending = False
+        elapsed = time.perf_counter() - start
+        delivered = len(self.latencies)
+        deadline = time.perf_counter() + drain_timeout
+        while self.sent_at and time.perf_counter() < deadline:
+            self.poll(0.1)
+        return elapsed, delivered
+
+    def close(self):
+        for client in self.clients:
+            if client.sock is not None:
+                self.selector.unregister(client.sock)
+                client.sock.close()
+        self.selector.close()
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу, в миллисекундах."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+
+def run(core, args):
+    """Один прогон для выбранного ядра сервера, результат - словарь метрик."""
+    names = [f'bench_{number}' for number in range(max(args.users, args.clients))]
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    codecs = [args.codec] if args.codec != 'json' else []
+    with tempfile.TemporaryDirectory() as directory:
+        ready = multiprocessing.Event()
+        stop = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=serve, args=(core, port, os.path.join(directory, 'bench.db3'), names, ready, stop, args.quiet))
+        process.start()
+        bench = Bench(port, names[:args.clients], args.window, args.payload, codecs)
+        try:
+            if not ready.wait(60):
+                raise TimeoutError('Сервер не запустился')
+            wait_listening(port, 10)
+            login_time = bench.login(args.timeout)
+            elapsed, delivered = bench.relay(args.duration, args.timeout)
+        finally:
+            stop.set()
+            process.join(30)
+            if process.is_alive():
+                process.terminate()
+            bench.close()
+    return {
+        'core': core,
+        'codec': args.codec,
+        'users': len(names),
+        'clients': args.clients,
+        'window': args.window,
+        'payload': args.payload,
+        'logins_per_sec': round(args.clients / login_time, 1),
+        'messages_per_sec': round(delivered / elapsed, 1),
+        'messages': delivered,
+        'lost': len(bench.sent_at),
+        'errors': bench.errors,
+        'latency_ms': {
+            'p50': percentile(bench.latencies, 0.50),
+            'p99': percentile(bench.latencies, 0.99),
+        },
+    }
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест пересылки сообщений')
+    parser.add_argument('--core', choices=('selectors', 'asyncio', 'both'), default='selectors')
+    parser.add_argument('--users', type=int, default=100, help='зарегистрировано пользователей')
+    parser.add_argument('--clients', type=int, default=50, help='одновременных клиентов')
+    parser.add_argument('--duration', type=float, default=5, help='длительность потока сообщений, с')
+    parser.add_argument('--window', type=int, default=4, help='неподтверждённых сообщений на клиента')
+    parser.add_argument('--payload', type=int, default=128, help='размер текста сообщения, байт')
+    parser.add_argument('--codec', choices=sorted(AVAILABLE_CODECS), default='json')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--quiet', action='store_true', help='журнал сервера только от WARNING')
+    parser.add_argument('--output', help='файл для JSON результата')
+    args = parser.parse_args()
+    if args.clients < 2:
+        parser.error('нужно хотя бы 2 клиента')
+    return args
+
+
+def main():
+    args = get_params()
+    cores = ('selectors', 'asyncio') if args.core == 'both' else (args.core,)
+    results = [run(core, args) for core in cores]
+    report = json.dumps(results if len(results) > 1 else results[0], indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report + '\n')
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
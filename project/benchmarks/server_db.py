@@ -0,0 +1,126 @@
+"""
+Время запросов базы сервера по мере роста истории подключений.
+
+База наполняется пользователями, контактами и событиями подключений
+до каждого из размеров --sizes (--per-day событий в день, дни идут
+назад от сегодняшнего); после каждого шага замеряются запросы, которые
+сервер выполняет при работе: список контактов, история подключений
+пользователя за последние сутки, удаление пользователя (в откатываемой
+транзакции). С --no-indexes индексы миграций удаляются, для сравнения.
+Срок хранения истории не ограничивается.
+
+    python -m benchmarks.server_db --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from server.server_database import ServerDB
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description='Запросы базы сервера на большой истории')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='число записей истории подключений')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--contacts', type=int, default=20, help='контактов у пользователя')
+    parser.add_argument('--per-day', type=int, default=50000, help='событий подключения в день')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--no-indexes', action='store_true')
+    return parser.parse_args()
+
+
+def fill_users(db, users, contacts):
+    connection = db.session.connection()
+    connection.execute(db.Clients.__table__.insert(),
+                       [{'login': f'user{number}', 'password_hash': 'hash', 'last_connect': datetime.now()}
+                        for number in range(users)])
+    connection.execute(db.HistoryAction.__table__.insert(),
+                       [{'client': number + 1, 'sent': 0, 'received': 0} for number in range(users)])
+    connection.execute(db.Contacts.__table__.insert(),
+                       [{'client': client, 'contact': contact}
+                        for client in range(1, users + 1)
+                        for contact in random.sample(range(1, users + 1), contacts)
+                        if contact != client])
+    db.session.commit()
+
+
+def fill_history(db, users, per_day, start, count):
+    """Добавить count событий, начиная с события номер start (считая от сегодня назад)."""
+    now = datetime.now()
+    for number in range(start, start + count, per_day):
+        day_start = datetime.combine(now.date() - timedelta(days=number // per_day), datetime.min.time())
+        table = db.history_partition(day_start.date())
+        step = min(per_day - number % per_day, start + count - number)
+        db.session.execute(table.insert(), [
+            {'client': random.randint(1, users), 'ip_address': '127.0.0.1', 'port': 7777,
+             'event': 'connect', 'event_time': day_start + timedelta(seconds=random.randrange(86400))}
+            for _ in range(step)])
+        db.session.commit()
+
+
+def remove_user_queries(db, user):
+    """Запросы remove_user без фиксации транзакции."""
+    client = db.get_user(user)
+    for table in db.history_tables.values():
+        db.session.execute(table.delete().where(table.c.client == client.id))
+    for table, column in ((db.HistoryAction, 'client'), (db.Contacts, 'client'), (db.Contacts, 'contact')):
+        db.session.query(table).filter_by(**{column: client.id}).delete()
+    db.session.rollback()
+
+
+def timed(func, users, repeat):
+    samples = []
+    for _ in range(repeat):
+        user = f'user{random.randrange(users)}'
+        start = time.perf_counter()
+        func(user)
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def main():
+    args = get_params()
+    random.seed(1)
+    directory = tempfile.TemporaryDirectory()
+    db = ServerDB(os.path.join(directory.name, 'bench.db3'), history_retention_days=None)
+    if args.no_indexes:
+        for table in db.Base.metadata.tables.values():
+            for index in table.indexes:
+                index.drop(db.engine)
+    fill_users(db, args.users, args.contacts)
+
+    results = []
+    filled = 0
+    for size in sorted(args.sizes):
+        fill_history(db, args.users, args.per_day, filled, size - filled)
+        filled = size
+        if args.no_indexes:
+            for table in db.history_tables.values():
+                for index in list(table.indexes):
+                    index.drop(db.engine, checkfirst=True)
+        results.append({
+            'history_rows': size,
+            'ms': {
+                'contacts_list': timed(db.contacts_list, args.users, args.repeat),
+                'history_clients_list': timed(
+                    lambda user: db.history_clients_list(user, since=datetime.now() - timedelta(days=1)),
+                    args.users, args.repeat),
+                'remove_user': timed(lambda user: remove_user_queries(db, user), args.users, args.repeat),
+            },
+        })
+    db.close()
+    directory.cleanup()
+    json.dump({'indexes': not args.no_indexes, 'users': args.users, 'results': results},
+              sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Микротест расшифровки пачки входящих сообщений: прежняя схема (PKCS1_OAEP
+на каждое сообщение) против сеансового ключа AES-GCM.
+
+    python -m benchmarks.session_crypto --messages 500
+"""
+import argparse
+import json
+import sys
+import time
+
+from Cryptodome.Cipher import PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+
+from client.session_crypto import SessionEncryptor, SessionDecryptor
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description='Расшифровка пачки сообщений')
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--size', type=int, default=128, help='длина текста сообщения, байт')
+    parser.add_argument('--bits', type=int, default=2048, help='длина ключа RSA')
+    return parser.parse_args()
+
+
+def timed(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return time.perf_counter() - start
+
+
+def main():
+    args = get_params()
+    keys = RSA.generate(args.bits)
+    text = b'x' * min(args.size, keys.size_in_bytes() - 42)
+    legacy = [PKCS1_OAEP.new(keys.publickey()).encrypt(text) for _ in range(args.messages)]
+    encryptor = SessionEncryptor(keys.publickey())
+    hybrid = [encryptor.encrypt(text) for _ in range(args.messages)]
+
+    legacy_time = timed(PKCS1_OAEP.new(keys).decrypt, legacy)
+    hybrid_time = timed(SessionDecryptor(keys).decrypt, hybrid)
+    results = {
+        'messages': args.messages,
+        'size': len(text),
+        'bits': args.bits,
+        'us_per_message': {
+            'rsa': round(legacy_time / args.messages * 1e6, 1),
+            'session': round(hybrid_time / args.messages * 1e6, 1),
+        },
+        'speedup': round(legacy_time / hybrid_time, 1),
+    }
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
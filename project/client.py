@@ -66,14 +66,15 @@ class Client:
             message = QMessageBox()
             message.critical(None, 'Ошибка сервера', error.text)
             exit(1)
-        self.transport.setDaemon(True)
-        self.transport.start()
 
         del start_dialog
 
         main_window = ClientMainWindow(self.database, self.transport, keys)
         main_window.make_connection(self.transport)
         main_window.setWindowTitle(f'Чат Программа alpha release - {self.client_name}')
+
+        self.transport.setDaemon(True)
+        self.transport.start()
         self.client_app.exec_()
 
         self.transport.transport_shutdown()
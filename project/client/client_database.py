@@ -1,8 +1,32 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Index, text, tuple_
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
+from utils import key_fingerprint
+
+# Версия схемы базы хранится в PRAGMA user_version файла .db3.
+SCHEMA_VERSION = 2
+
+# Полнотекстовый индекс истории: внешнее содержимое берётся из
+# history_messages, триггеры держат индекс в согласии с таблицей.
+HISTORY_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+    "message, content='history_messages', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history_messages BEGIN "
+    "INSERT INTO history_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history_messages BEGIN "
+    "INSERT INTO history_fts(history_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF message ON history_messages BEGIN "
+    "INSERT INTO history_fts(history_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+    "INSERT INTO history_fts(rowid, message) VALUES (new.id, new.message); END",
+    "INSERT INTO history_fts(history_fts) VALUES ('rebuild')",
+)
+SEARCH_LIMIT = 50
+# Сколько имён подставлять в один запрос IN при удалении.
+DELETE_CHUNK = 500
+
 
 class ClientDB:
     Base = declarative_base()
@@ -15,6 +39,12 @@ class ClientDB:
         def __init__(self, username):
             self.username = username
 
+    class SyncState(Base):
+        """Версии данных, синхронизированных с сервером."""
+        __tablename__ = 'sync_state'
+        name = Column(String, primary_key=True)
+        version = Column(Integer)
+
     class Contacts(Base):
         __tablename__ = 'contacts'
         id = Column(Integer, primary_key=True)
@@ -23,8 +53,21 @@ class ClientDB:
         def __init__(self, name):
             self.name = name
 
+    class PublicKeys(Base):
+        __tablename__ = 'public_keys'
+        id = Column(Integer, primary_key=True)
+        username = Column(String, unique=True)
+        fingerprint = Column(String)
+        pub_key = Column(Text)
+
+        def __init__(self, username, pub_key):
+            self.username = username
+            self.fingerprint = key_fingerprint(pub_key)
+            self.pub_key = pub_key
+
     class HistoryMessages(Base):
         __tablename__ = 'history_messages'
+        __table_args__ = (Index('ix_history_contact_time', 'contact', 'message_time', 'id'),)
         id = Column(Integer, primary_key=True)
         contact = Column(String)
         status = Column(String)
@@ -42,12 +85,31 @@ class ClientDB:
                                     connect_args={'check_same_thread': False})
 
         self.Base.metadata.create_all(self.engine)
+        self.migrate()
         Session = sessionmaker(bind=self.engine)
         self.session = Session()
 
         self.session.query(self.Contacts).delete()
         self.session.commit()
 
+    def migrate(self):
+        """
+        Довести схему существующего файла базы до SCHEMA_VERSION.
+        create_all создаёт только отсутствующие таблицы, поэтому индексы
+        и прочие изменения старых таблиц добавляются здесь.
+        """
+        with self.engine.begin() as connection:
+            version = connection.exec_driver_sql('PRAGMA user_version').scalar()
+            if version >= SCHEMA_VERSION:
+                return
+            if version < 1:
+                for index in self.HistoryMessages.__table__.indexes:
+                    index.create(connection, checkfirst=True)
+            if version < 2:
+                for statement in HISTORY_FTS:
+                    connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
     def add_contact(self, name):
         if not self.session.query(self.Contacts).filter_by(name=name).first():
             new_contact = self.Contacts(name)
@@ -60,20 +122,43 @@ class ClientDB:
             self.session.commit()
 
     def save_message(self, contact, status, message):
+        """Сохранить сообщение; возвращает строку истории в формате get_history."""
         message_row = self.HistoryMessages(contact, status, message)
         self.session.add(message_row)
         self.session.commit()
+        return contact, status, message, message_row.message_time, message_row.id
 
     def get_contacts(self):
         return [contact[0] for contact in self.session.query(self.Contacts.name).all()]
 
-    def add_users(self, users_list):
-        self.session.query(self.KnownUsers).delete()
-        for user in users_list:
-            user_row = self.KnownUsers(user)
-            self.session.add(user_row)
+    def add_users(self, users_list, version=None):
+        """
+        Заменить список известных пользователей полным списком с сервера.
+        Удаляются и добавляются только отличающиеся имена.
+        """
+        known = set(self.get_users())
+        users = set(users_list)
+        self.update_users(users - known, known - users, version)
+
+    def update_users(self, added, removed, version=None):
+        """Применить изменения списка пользователей пакетными запросами."""
+        table = self.KnownUsers.__table__
+        if added:
+            self.session.execute(insert(table).on_conflict_do_nothing(index_elements=['username']),
+                                 [{'username': user} for user in added])
+        removed = list(removed)
+        for start in range(0, len(removed), DELETE_CHUNK):
+            self.session.execute(table.delete().where(
+                table.c.username.in_(removed[start:start + DELETE_CHUNK])))
+        if version is not None:
+            self.session.merge(self.SyncState(name='users', version=version))
         self.session.commit()
 
+    def get_users_version(self):
+        """Версия списка пользователей, полученная с сервера, или None."""
+        row = self.session.query(self.SyncState.version).filter_by(name='users').first()
+        return row[0] if row else None
+
     def get_users(self):
         return [user[0] for user in self.session.query(self.KnownUsers.username).all()]
 
@@ -89,10 +174,81 @@ class ClientDB:
         else:
             return False
 
-    def get_history(self, contact):
-        query = self.session.query(self.HistoryMessages).filter_by(contact=contact).all()
-        return [(history_row.contact, history_row.status, history_row.message, history_row.message_time)
-                for history_row in query]
+    def get_public_key(self, user):
+        """Публичный ключ пользователя из кэша или None."""
+        row = self.session.query(self.PublicKeys.pub_key).filter_by(username=user).first()
+        return row[0] if row else None
+
+    def save_public_key(self, user, pub_key):
+        """Запомнить или заменить публичный ключ пользователя."""
+        row = self.session.query(self.PublicKeys).filter_by(username=user).first()
+        if row is None:
+            self.session.add(self.PublicKeys(user, pub_key))
+        elif row.pub_key != pub_key:
+            row.pub_key = pub_key
+            row.fingerprint = key_fingerprint(pub_key)
+        self.session.commit()
+
+    def del_public_key(self, user):
+        self.session.query(self.PublicKeys).filter_by(username=user).delete()
+        self.session.commit()
+
+    def public_key_fingerprints(self):
+        """Словарь имя: отпечаток для сверки кэша с сервером."""
+        return dict(self.session.query(self.PublicKeys.username, self.PublicKeys.fingerprint).all())
+
+    def get_history(self, contact, before=None, limit=None):
+        """
+        История переписки с контактом от старых сообщений к новым, строки
+        (contact, status, message, message_time, id). before - пара
+        (message_time, id) строки, старше которой выбирать: сообщения с тем
+        же временем различаются по id, поэтому ни одно не теряется на
+        границе страниц. limit - не больше limit последних сообщений.
+        Выборка идёт по индексу (contact, message_time, id), так что
+        страница читается без сортировки и без просмотра остальной истории.
+        """
+        query = self.session.query(self.HistoryMessages.contact,
+                                   self.HistoryMessages.status,
+                                   self.HistoryMessages.message,
+                                   self.HistoryMessages.message_time,
+                                   self.HistoryMessages.id).filter_by(contact=contact)
+        if before is not None:
+            query = query.filter(tuple_(self.HistoryMessages.message_time,
+                                        self.HistoryMessages.id) < tuple_(*before))
+        if limit is None:
+            return [tuple(row) for row in query.order_by(self.HistoryMessages.message_time,
+                                                         self.HistoryMessages.id).all()]
+        rows = query.order_by(self.HistoryMessages.message_time.desc(),
+                              self.HistoryMessages.id.desc()).limit(limit).all()
+        return [tuple(row) for row in reversed(rows)]
+
+    def search_history(self, query, contact=None, limit=SEARCH_LIMIT):
+        """
+        Поиск по тексту истории. Возвращает до limit лучших совпадений
+        в виде (contact, status, message, message_time, id, snippet), где
+        snippet - фрагмент сообщения с найденными словами в [скобках].
+        Первые пять полей - строка в формате get_history, (message_time, id)
+        годится как before, чтобы открыть историю от найденного сообщения.
+        Равные по rank совпадения идут от новых к старым.
+        Каждое слово запроса ищется как есть, последнее - ещё и как начало
+        слова, так что синтаксис FTS5 во вводе пользователя не нужен.
+        """
+        words = query.split()
+        if not words:
+            return []
+        match = ' '.join('"' + word.replace('"', '""') + '"' for word in words) + '*'
+        sql = ('SELECT h.contact, h.status, h.message, h.message_time, h.id, '
+               "snippet(history_fts, 0, '[', ']', '...', 10) AS snippet "
+               'FROM history_fts JOIN history_messages AS h ON h.id = history_fts.rowid '
+               'WHERE history_fts MATCH :match')
+        params = {'match': match, 'limit': limit}
+        if contact is not None:
+            sql += ' AND h.contact = :contact'
+            params['contact'] = contact
+        sql += ' ORDER BY rank, h.message_time DESC, h.id DESC LIMIT :limit'
+        statement = text(sql).columns(contact=String, status=String, message=String,
+                                      message_time=DateTime, id=Integer, snippet=String)
+        return [tuple(row) for row in self.session.execute(statement, params)]
 
 
 if __name__ == '__main__':
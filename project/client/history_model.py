@@ -0,0 +1,82 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+from PyQt5.QtGui import QBrush, QColor
+
+PAGE_SIZE = 50
+
+
+class HistoryModel(QAbstractListModel):
+    """
+    Модель истории переписки с одним контактом.
+
+    Хранит только загруженное окно сообщений, от старых к новым. При выборе
+    чата загружается последняя страница, более старые страницы подгружаются
+    через load_older при прокрутке к началу, новые сообщения добавляются
+    в конец через append без перечитывания истории.
+    """
+
+    def __init__(self, database, page_size=PAGE_SIZE):
+        super().__init__()
+        self.database = database
+        self.page_size = page_size
+        self.contact = None
+        self.rows = []
+        self.has_older = False
+
+    def set_contact(self, contact):
+        """Показать историю контакта, начиная с последней страницы."""
+        self.beginResetModel()
+        self.contact = contact
+        self.rows = []
+        self.has_older = False
+        if contact:
+            self.rows = self.database.get_history(contact, limit=self.page_size)
+            self.has_older = len(self.rows) == self.page_size
+        self.endResetModel()
+
+    def can_load_older(self):
+        return self.has_older
+
+    def load_older(self):
+        """Подгрузить страницу сообщений старше загруженных. Возвращает число строк."""
+        if not self.has_older or not self.rows:
+            return 0
+        oldest = self.rows[0]
+        older = self.database.get_history(self.contact, before=(oldest[3], oldest[4]), limit=self.page_size)
+        self.has_older = len(older) == self.page_size
+        if older:
+            self.beginInsertRows(QModelIndex(), 0, len(older) - 1)
+            self.rows[:0] = older
+            self.endInsertRows()
+        return len(older)
+
+    def append(self, contact, status, message, message_time, message_id):
+        """Добавить новое сообщение в конец, если открыт чат с этим контактом."""
+        if contact != self.contact:
+            return
+        row = len(self.rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rows.append((contact, status, message, message_time, message_id))
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        contact, status, message, message_time, message_id = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            if status == 'in':
+                return f'Входящее от {message_time.replace(microsecond=0)}:\n {message}'
+            return f'Исходящее от {message_time.replace(microsecond=0)}:\n {message}'
+        if role == Qt.BackgroundRole:
+            if status == 'in':
+                return QBrush(QColor(255, 213, 213))
+            return QBrush(QColor(204, 255, 204))
+        if role == Qt.TextAlignmentRole:
+            if status == 'in':
+                return Qt.AlignLeft
+            return Qt.AlignRight
+        return None
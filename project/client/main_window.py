@@ -1,7 +1,6 @@
-from PyQt5.QtWidgets import QMainWindow, qApp, QMessageBox, QApplication
-from PyQt5.QtGui import QStandardItemModel, QStandardItem, QBrush, QColor
+from PyQt5.QtWidgets import QMainWindow, qApp, QMessageBox, QApplication, QAbstractItemView
+from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from PyQt5.QtCore import pyqtSlot, Qt
-from Cryptodome.Cipher import PKCS1_OAEP
 from Cryptodome.PublicKey import RSA
 import base64
 import json
@@ -12,6 +11,8 @@ sys.path.append('../')
 from client.main_window_conv import Ui_MainClientWindow
 from client.add_contact import AddContactDialog
 from client.del_contact import DelContactDialog
+from client.session_crypto import SessionEncryptor, SessionDecryptor
+from client.history_model import HistoryModel
 from constants import *
 from errors import ServerError
 
@@ -24,7 +25,8 @@ class ClientMainWindow(QMainWindow):
         super().__init__()
         self.database = database
         self.transport = transport
-        self.decrypter = PKCS1_OAEP.new(keys)
+        self.decrypter = SessionDecryptor(keys)
+        self.encryptors = dict()
 
         self.ui = Ui_MainClientWindow()
         self.ui.setupUi(self)
@@ -40,13 +42,15 @@ class ClientMainWindow(QMainWindow):
         self.ui.menu_del_contact.triggered.connect(self.delete_contact_window)
 
         self.contacts_model = None
-        self.history_model = None
+        self.history_model = HistoryModel(database)
         self.messages = QMessageBox()
         self.current_chat = None
         self.current_chat_key = None
         self.encryptor = None
         self.ui.list_messages.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.ui.list_messages.setWordWrap(True)
+        self.ui.list_messages.setModel(self.history_model)
+        self.ui.list_messages.verticalScrollBar().valueChanged.connect(self.history_scrolled)
 
         self.ui.list_contacts.doubleClicked.connect(self.select_active_user)
 
@@ -58,8 +62,7 @@ class ClientMainWindow(QMainWindow):
         self.ui.label_new_message.setText('Для выбора получателя '
                                           'дважды кликните на нем в окне контактов.')
         self.ui.text_message.clear()
-        if self.history_model:
-            self.history_model.clear()
+        self.history_model.set_contact(None)
 
         self.ui.btn_clear.setDisabled(True)
         self.ui.btn_send.setDisabled(True)
@@ -70,45 +73,46 @@ class ClientMainWindow(QMainWindow):
         self.current_chat_key = None
 
     def history_list_update(self):
-        list_messages = sorted(self.database.get_history(self.current_chat), key=lambda column: column[3])
-        if not self.history_model:
-            self.history_model = QStandardItemModel()
-            self.ui.list_messages.setModel(self.history_model)
-        self.history_model.clear()
-
-        length = len(list_messages)
-        start_index = 0
-        if length > 20:
-            start_index = length - 20
-
-        for i in range(start_index, length):
-            item = list_messages[i]
-            if item[1] == 'in':
-                mess = QStandardItem(f'Входящее от {item[3].replace(microsecond=0)}:\n {item[2]}')
-                mess.setEditable(False)
-                mess.setBackground(QBrush(QColor(255, 213, 213)))
-                mess.setTextAlignment(Qt.AlignLeft)
-                self.history_model.appendRow(mess)
-            else:
-                mess = QStandardItem(f'Исходящее от {item[3].replace(microsecond=0)}:\n {item[2]}')
-                mess.setEditable(False)
-                mess.setTextAlignment(Qt.AlignRight)
-                mess.setBackground(QBrush(QColor(204, 255, 204)))
-                self.history_model.appendRow(mess)
+        """Открыть историю текущего чата с последней страницы."""
+        self.history_model.set_contact(self.current_chat)
         self.ui.list_messages.scrollToBottom()
 
+    def history_scrolled(self, value):
+        """При прокрутке к началу подгрузить более старые сообщения."""
+        if value == self.ui.list_messages.verticalScrollBar().minimum() \
+                and self.history_model.can_load_older():
+            loaded = self.history_model.load_older()
+            if loaded:
+                self.ui.list_messages.scrollTo(self.history_model.index(loaded),
+                                               QAbstractItemView.PositionAtTop)
+
+    def history_append(self, contact, status, message, message_time, message_id):
+        """Добавить сообщение в открытый чат без перечитывания истории."""
+        scroll_bar = self.ui.list_messages.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+        self.history_model.append(contact, status, message, message_time, message_id)
+        if at_bottom:
+            self.ui.list_messages.scrollToBottom()
+
     def select_active_user(self):
         self.current_chat = self.ui.list_contacts.currentIndex().data()
         self.set_active_user()
 
     def set_active_user(self):
         try:
-            self.current_chat_key = self.transport.key_request(
-                self.current_chat)
+            self.current_chat_key = self.database.get_public_key(self.current_chat)
+            cached = bool(self.current_chat_key)
+            if not cached:
+                self.current_chat_key = self.transport.key_request(
+                    self.current_chat)
             if self.current_chat_key:
-                self.encryptor = PKCS1_OAEP.new(
-                    RSA.import_key(self.current_chat_key))
-        except (OSError, json.JSONDecodeError):
+                session = (self.current_chat, self.current_chat_key)
+                if session not in self.encryptors:
+                    self.encryptors[session] = SessionEncryptor(RSA.import_key(self.current_chat_key))
+                self.encryptor = self.encryptors[session]
+                if not cached:
+                    self.database.save_public_key(self.current_chat, self.current_chat_key)
+        except (OSError, json.JSONDecodeError, ValueError):
             self.current_chat_key = None
             self.encryptor = None
 
@@ -194,10 +198,8 @@ class ClientMainWindow(QMainWindow):
             return
         message_text_encrypted = self.encryptor.encrypt(
             message_text.encode('utf8'))
-        message_text_encrypted_base64 = base64.b64encode(
-            message_text_encrypted)
         try:
-            self.transport.send_message(self.current_chat, message_text_encrypted_base64.decode('ascii'))
+            self.transport.send_message(self.current_chat, message_text_encrypted)
         except ServerError as err:
             self.messages.critical(self, 'Ошибка', err.text)
         except OSError as err:
@@ -209,30 +211,32 @@ class ClientMainWindow(QMainWindow):
             self.messages.critical(self, 'Ошибка', 'Потеряно соединение с сервером!')
             self.close()
         else:
-            self.database.save_message(self.current_chat, 'out', message_text)
+            row = self.database.save_message(self.current_chat, 'out', message_text)
             logger.debug(f'Отправлено сообщение для {self.current_chat}: {message_text}')
 
-            self.history_list_update()
+            self.history_append(*row)
 
     @pyqtSlot(dict)
     def message(self, message):
 
-        encrypted_message = base64.b64decode(message[MESSAGE_TEXT])
         try:
+            encrypted_message = message[MESSAGE_TEXT]
+            if isinstance(encrypted_message, str):
+                encrypted_message = base64.b64decode(encrypted_message)
             decrypted_message = self.decrypter.decrypt(encrypted_message)
         except (ValueError, TypeError):
             self.messages.warning(
                 self, 'Ошибка', 'Не удалось декодировать сообщение.')
             return
 
-        self.database.save_message(
-            self.current_chat,
+        sender = message[FROM]
+        row = self.database.save_message(
+            sender,
             'in',
             decrypted_message.decode('utf8'))
-        sender = message[FROM]
 
         if sender == self.current_chat:
-            self.history_list_update()
+            self.history_append(*row)
         else:
             if self.database.check_contact(sender):
                 if self.messages.question(self, 'Новое сообщение',
@@ -251,6 +255,21 @@ class ClientMainWindow(QMainWindow):
                     self.current_chat = sender
                     self.set_active_user()
 
+    @pyqtSlot(str, str)
+    def public_key_changed(self, user, pub_key):
+        """Собеседник сменил ключ: обновить кэш и шифрование текущего чата."""
+        try:
+            encryptor = SessionEncryptor(RSA.import_key(pub_key))
+        except ValueError:
+            logger.error(f'Получен некорректный публичный ключ пользователя {user}')
+            return
+        self.database.save_public_key(user, pub_key)
+        for session in [session for session in self.encryptors if session[0] == user]:
+            del self.encryptors[session]
+        if user == self.current_chat:
+            self.current_chat_key = pub_key
+            self.encryptor = self.encryptors[(user, pub_key)] = encryptor
+
     @pyqtSlot()
     def connection_lost(self):
         self.messages.warning(self, 'Сбой соединения', 'Потеряно соединение с сервером. ')
@@ -271,6 +290,7 @@ class ClientMainWindow(QMainWindow):
     def make_connection(self, trans_obj):
         trans_obj.new_message.connect(self.message)
         trans_obj.connection_lost.connect(self.connection_lost)
+        trans_obj.public_key_changed.connect(self.public_key_changed)
         trans_obj.message_205.connect(self.sig_205)
 
 
@@ -0,0 +1,95 @@
+"""Гибридное шифрование сообщений: сеансовый ключ AES-GCM, обёрнутый RSA."""
+import struct
+from collections import OrderedDict
+
+from Cryptodome.Cipher import AES, PKCS1_OAEP
+from Cryptodome.Random import get_random_bytes
+
+VERSION = 1
+HEADER = struct.Struct('>BH')
+NONCE_SIZE = 12
+TAG_SIZE = 16
+SESSION_KEY_SIZE = 32
+REKEY_MESSAGES = 1000
+CACHED_SESSIONS = 256
+
+
+class SessionEncryptor:
+    """
+    Шифрование сообщений для одного собеседника.
+
+    Сеансовый ключ AES-256 шифруется открытым ключом RSA собеседника один
+    раз на сеанс, сообщения шифруются AES-GCM. После rekey_after сообщений
+    создаётся новый сеансовый ключ.
+
+    Формат сообщения: версия (1 байт), длина обёрнутого ключа (2 байта),
+    обёрнутый ключ, nonce, тег GCM, шифротекст. Обёрнутый ключ передаётся
+    в каждом сообщении, поэтому любое сообщение, в том числе отложенное,
+    расшифровывается независимо от остальных.
+    """
+
+    def __init__(self, public_key, rekey_after=REKEY_MESSAGES):
+        self.wrapper = PKCS1_OAEP.new(public_key)
+        self.rekey_after = rekey_after
+        self.key = None
+        self.header = None
+        self.count = 0
+
+    def new_session(self):
+        """Создать новый сеансовый ключ."""
+        self.key = get_random_bytes(SESSION_KEY_SIZE)
+        wrapped = self.wrapper.encrypt(self.key)
+        self.header = HEADER.pack(VERSION, len(wrapped)) + wrapped
+        self.count = 0
+
+    def encrypt(self, data):
+        if self.key is None or self.count >= self.rekey_after:
+            self.new_session()
+        self.count += 1
+        nonce = get_random_bytes(NONCE_SIZE)
+        ciphertext, tag = AES.new(self.key, AES.MODE_GCM, nonce=nonce).encrypt_and_digest(data)
+        return b''.join((self.header, nonce, tag, ciphertext))
+
+
+class SessionDecryptor:
+    """
+    Расшифровка входящих сообщений своим закрытым ключом RSA.
+
+    Развёрнутые сеансовые ключи кэшируются по обёрнутому ключу, так что
+    операция RSA выполняется один раз на сеанс, а не на каждое сообщение.
+    Сообщения старого формата (RSA без сеансового ключа) имеют длину
+    ровно в размер ключа RSA и расшифровываются напрямую.
+    """
+
+    def __init__(self, private_key, cached_sessions=CACHED_SESSIONS):
+        self.unwrapper = PKCS1_OAEP.new(private_key)
+        self.rsa_size = private_key.size_in_bytes()
+        self.cached_sessions = cached_sessions
+        self.sessions = OrderedDict()
+
+    def session_key(self, wrapped):
+        key = self.sessions.get(wrapped)
+        if key is None:
+            key = self.unwrapper.decrypt(wrapped)
+            self.sessions[wrapped] = key
+            if len(self.sessions) > self.cached_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(wrapped)
+        return key
+
+    def decrypt(self, data):
+        """Расшифровать сообщение; ValueError, если оно повреждено или подделано."""
+        if len(data) == self.rsa_size:
+            return self.unwrapper.decrypt(data)
+        if len(data) < HEADER.size:
+            raise ValueError('Сообщение слишком короткое')
+        version, wrapped_size = HEADER.unpack_from(data)
+        start = HEADER.size + wrapped_size
+        if version != VERSION or len(data) < start + NONCE_SIZE + TAG_SIZE:
+            raise ValueError('Неизвестный формат сообщения')
+        key = self.session_key(bytes(data[HEADER.size:start]))
+        nonce = data[start:start + NONCE_SIZE]
+        tag = data[start + NONCE_SIZE:start + NONCE_SIZE + TAG_SIZE]
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        return cipher.decrypt_and_verify(data[start + NONCE_SIZE + TAG_SIZE:], tag)
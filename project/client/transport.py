@@ -1,11 +1,14 @@
 import socket
 import time
 import threading
+import itertools
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import hashlib
 import hmac
 import binascii
 from utils import *
-from errors import ServerError
+from errors import ServerError, IncorrectDataRecivedError
 from logs.decos import log
 from PyQt5.QtCore import pyqtSignal, QObject
 
@@ -18,6 +21,7 @@ database_lock = threading.Lock()
 class ClientTransport(threading.Thread, QObject):
 
     new_message = pyqtSignal(dict)
+    public_key_changed = pyqtSignal(str, str)
     message_205 = pyqtSignal()
     connection_lost = pyqtSignal()
 
@@ -32,17 +36,25 @@ class ClientTransport(threading.Thread, QObject):
         self.keys = keys
         self.database = database
         self.transport = None
+        self.pending_messages = []
+        self.reader_started = False
+        self.request_ids = itertools.count(1)
+        self.requests = dict()
+        self.requests_order = deque()
+        self.requests_lock = threading.Lock()
+        self.requests_failed = False
 
         self.connection_init()
         try:
             self.user_list_request()
             self.contacts_list_request()
+            self.public_keys_check()
         except OSError as err:
             if err.errno:
                 logger.critical(f'Потеряно соединение с сервером.')
                 raise ServerError('Потеряно соединение с сервером!')
             logger.error('Timeout соединения при обновлении списков пользователей.')
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, IncorrectDataRecivedError):
             logger.critical(f'Потеряно соединение с сервером.')
             raise ServerError('Потеряно соединение с сервером!')
         self.running = True
@@ -94,8 +106,12 @@ class ClientTransport(threading.Thread, QObject):
                         my_ans = {RESPONSE: 511,
                                   ALERT: binascii.b2a_base64(digest).decode('ascii')}
                         send_message(self.transport, my_ans)
-                        self.process_server_ans(get_message(self.transport))
-        except (OSError, json.JSONDecodeError) as err:
+                        ans = self.get_reply()
+                        if CODEC in ans:
+                            get_framer(self.transport).codec = AVAILABLE_CODECS[ans[CODEC]]
+                            logger.debug(f'Сервер выбрал кодек {ans[CODEC]}')
+                        self.process_server_ans(ans)
+        except (OSError, json.JSONDecodeError, IncorrectDataRecivedError) as err:
             logger.debug(f'Connection error.', exc_info=err)
             raise ServerError('Сбой соединения в процессе авторизации.')
 
@@ -108,11 +124,16 @@ class ClientTransport(threading.Thread, QObject):
             TIME: time.time(),
             ACCOUNT_NAME: self.account_name
         }
-        with sock_lock:
-            send_message(self.transport, req)
-            ans = get_message(self.transport)
+        version = self.database.get_users_version()
+        if version:
+            req[USERS_VERSION] = version
+        ans = self.send_request(req)
         if RESPONSE in ans and ans[RESPONSE] == 202:
-            self.database.add_users(ans[ALERT])
+            if REMOVED in ans:
+                logger.debug(f'Изменения списка пользователей: +{len(ans[ALERT])}, -{len(ans[REMOVED])}')
+                self.database.update_users(ans[ALERT], ans[REMOVED], ans.get(USERS_VERSION))
+            else:
+                self.database.add_users(ans[ALERT], ans.get(USERS_VERSION))
         else:
             raise ServerError
 
@@ -124,8 +145,7 @@ class ClientTransport(threading.Thread, QObject):
             USER: self.account_name
         }
         logger.debug(f'Сформирован запрос {req}')
-        send_message(self.transport, req)
-        ans = get_message(self.transport)
+        ans = self.send_request(req)
         logger.debug(f'Получен ответ {ans}')
         if RESPONSE in ans and ans[RESPONSE] == 202:
             for el in ans[ALERT]:
@@ -133,6 +153,26 @@ class ClientTransport(threading.Thread, QObject):
         else:
             raise ServerError
 
+    def public_keys_check(self):
+        """Сверить кэш публичных ключей с сервером: ключи, сменённые, пока клиент был не в сети."""
+        fingerprints = self.database.public_key_fingerprints()
+        if not fingerprints:
+            return
+        ans = self.send_request({
+            ACTION: PUBLIC_KEY_CHECK,
+            TIME: time.time(),
+            USER: fingerprints
+        })
+        if RESPONSE in ans and ans[RESPONSE] == 202:
+            for user, pub_key in ans[ALERT].items():
+                logger.debug(f'Обновлён публичный ключ пользователя {user}')
+                if pub_key:
+                    self.database.save_public_key(user, pub_key)
+                else:
+                    self.database.del_public_key(user)
+        else:
+            logger.error('Не удалось сверить кэш публичных ключей.')
+
     def create_presence(self, pubkey):
         out = {
             ACTION: PRESENCE,
@@ -140,7 +180,8 @@ class ClientTransport(threading.Thread, QObject):
             USER: {
                 ACCOUNT_NAME: self.account_name,
                 PUBLIC_KEY: pubkey
-            }
+            },
+            CODECS: list(AVAILABLE_CODECS)
         }
         logger.debug(f'Сформировано {PRESENCE} сообщение для пользователя {self.account_name}')
         return out
@@ -169,10 +210,8 @@ class ClientTransport(threading.Thread, QObject):
             MESSAGE_TEXT: message
         }
         logger.debug(f'Сформирован словарь сообщения: {message_dict}')
-        with sock_lock:
-            send_message(self.transport, message_dict)
-            self.process_server_ans(get_message(self.transport))
-            logger.info(f'Отправлено сообщение для пользователя {to}')
+        self.process_server_ans(self.send_request(message_dict))
+        logger.info(f'Отправлено сообщение для пользователя {to}')
 
     def key_request(self, user):
         logger.debug(f'Запрос публичного ключа для {user}')
@@ -181,14 +220,102 @@ class ClientTransport(threading.Thread, QObject):
             TIME: time.time(),
             ACCOUNT_NAME: user
         }
-        with sock_lock:
-            send_message(self.transport, req)
-            ans = get_message(self.transport)
+        ans = self.send_request(req)
         if RESPONSE in ans and ans[RESPONSE] == 511:
             return ans[ALERT]
         else:
             logger.error(f'Не удалось получить ключ собеседника{user}.')
 
+    def get_reply(self):
+        """
+        Прочитать из сокета ответ сервера на этапе авторизации, до запуска
+        приёмника. Сообщения, пришедшие раньше ответа (например, доставка
+        отложенных после входа), откладываются для приёмника.
+        """
+        while True:
+            message = get_message(self.transport)
+            if RESPONSE in message:
+                return message
+            self.pending_messages.append(message)
+
+    def submit_request(self, request):
+        """
+        Отправить запрос, не дожидаясь ответа, и вернуть Future ответа.
+
+        Запросу присваивается REQUEST_ID, по которому сервер помечает ответ,
+        поэтому одновременно в пути может быть несколько запросов. Ответ без
+        REQUEST_ID (старый сервер) относится к самому раннему запросу.
+        """
+        future = Future()
+        with sock_lock:
+            request_id = next(self.request_ids)
+            request[REQUEST_ID] = future.request_id = request_id
+            with self.requests_lock:
+                if self.requests_failed:
+                    raise ConnectionResetError(errno.ECONNRESET, 'Потеряно соединение с сервером')
+                self.requests[request_id] = future
+                self.requests_order.append(request_id)
+            send_message(self.transport, request)
+        return future
+
+    def wait_reply(self, future):
+        """Дождаться ответа на запрос. Пока приёмник не запущен, сокет читается здесь."""
+        if not self.reader_started:
+            while not future.done():
+                self.dispatch(get_message(self.transport))
+            return future.result()
+        try:
+            return future.result(self.transport.gettimeout())
+        except FutureTimeoutError:
+            self.forget_request(future.request_id)
+            raise TimeoutError('Сервер не ответил на запрос')
+
+    def forget_request(self, request_id):
+        """
+        Снять запрос, ответа на который больше не ждут, чтобы следующие
+        ответы без REQUEST_ID не сопоставлялись с ним.
+        """
+        with self.requests_lock:
+            if self.requests.pop(request_id, None) is not None:
+                self.requests_order.remove(request_id)
+
+    def send_request(self, request):
+        """Отправить запрос и дождаться ответа на него."""
+        return self.wait_reply(self.submit_request(request))
+
+    def dispatch(self, message):
+        """Передать ответ ожидающему запросу, входящее сообщение - на обработку."""
+        if RESPONSE not in message:
+            if self.reader_started:
+                self.process_server_ans(message)
+            else:
+                self.pending_messages.append(message)
+            return
+        with self.requests_lock:
+            if REQUEST_ID in message:
+                future = self.requests.pop(message[REQUEST_ID], None)
+                if future is not None:
+                    self.requests_order.remove(message[REQUEST_ID])
+            elif self.requests_order:
+                future = self.requests.pop(self.requests_order.popleft())
+            else:
+                future = None
+        if future is None:
+            logger.debug(f'Получен ответ без запроса: {message}')
+        elif not future.done():
+            future.set_result(message)
+
+    def fail_requests(self):
+        """Завершить ошибкой все запросы, ожидающие ответа."""
+        with self.requests_lock:
+            self.requests_failed = True
+            futures = list(self.requests.values())
+            self.requests.clear()
+            self.requests_order.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(ConnectionResetError(errno.ECONNRESET, 'Потеряно соединение с сервером'))
+
     def process_server_ans(self, message):
         logger.debug(f'Разбор сообщения от сервера: {message}')
         if RESPONSE in message:
@@ -209,29 +336,40 @@ class ClientTransport(threading.Thread, QObject):
                          f'{message[MESSAGE_TEXT]}')
             self.new_message.emit(message)
 
+        elif ACTION in message \
+                and message[ACTION] == PUBLIC_KEY_UPDATE \
+                and ACCOUNT_NAME in message \
+                and PUBLIC_KEY in message:
+            logger.debug(f'Пользователь {message[ACCOUNT_NAME]} сменил публичный ключ')
+            self.public_key_changed.emit(message[ACCOUNT_NAME], message[PUBLIC_KEY])
+
+    def start(self):
+        self.reader_started = True
+        super().start()
+
     def run(self):
+        """
+        Приёмник: ждёт данных на сокете и разбирает всё, что пришло.
+        Ответы передаются ожидающим запросам, входящие сообщения
+        обрабатываются сразу.
+        """
         logger.debug('Запущен процесс - приёмник сообщений с сервера.')
+        while self.pending_messages:
+            self.process_server_ans(self.pending_messages.pop(0))
         while self.running:
-            time.sleep(1)
-            with sock_lock:
-                try:
-                    self.transport.settimeout(0.5)
-                    message = get_message(self.transport)
-                except OSError as err:
-                    if err.errno:
-                        logger.critical(f'Потеряно соединение с сервером.')
-                        self.running = False
-                        self.connection_lost.emit()
-                except (ConnectionError, ConnectionAbortedError,
-                        ConnectionResetError, json.JSONDecodeError, TypeError):
-                    logger.debug(f'Потеряно соединение с сервером.')
+            try:
+                message = get_message(self.transport)
+            except socket.timeout:
+                continue
+            except (OSError, json.JSONDecodeError, IncorrectDataRecivedError, TypeError):
+                if self.running:
+                    logger.critical(f'Потеряно соединение с сервером.')
                     self.running = False
                     self.connection_lost.emit()
-                else:
-                    logger.debug(f'Принято сообщение с сервера: {message}')
-                    self.process_server_ans(message)
-                finally:
-                    self.transport.settimeout(5)
+                break
+            logger.debug(f'Принято сообщение с сервера: {message}')
+            self.dispatch(message)
+        self.fail_requests()
 
     def add_contact(self, contact):
         logger.debug(f'Создание контакта {contact}')
@@ -241,8 +379,7 @@ class ClientTransport(threading.Thread, QObject):
             USER: self.account_name,
             CONTACT: contact
         }
-        send_message(self.transport, req)
-        ans = get_message(self.transport)
+        ans = self.send_request(req)
         if RESPONSE in ans and ans[RESPONSE] == 200:
             pass
         else:
@@ -256,8 +393,7 @@ class ClientTransport(threading.Thread, QObject):
             USER: self.account_name,
             CONTACT: contact
         }
-        send_message(self.transport, req)
-        ans = get_message(self.transport)
+        ans = self.send_request(req)
         if RESPONSE in ans and ans[RESPONSE] == 200:
             pass
         else:
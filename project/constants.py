@@ -5,6 +5,11 @@ DEFAULT_PORT = 7777
 DEFAULT_SERVER_ADDRESS = '127.0.0.1'
 REQUEST_NUMBER = 5
 MAX_PACKAGES_LENGTH = 1000000
+RECV_BUFFER_SIZE = 65536
+OUTBOUND_HIGH_WATERMARK = 1048576
+OUTBOUND_LOW_WATERMARK = 262144
+OUTBOUND_POLICY = 'disconnect'
+HANDSHAKE_TIMEOUT = 5
 
 # Encoding
 ENCODING = 'utf-8'
@@ -30,3 +35,10 @@ DEL_CONTACT = 'del_contact'
 CONTACT = 'contact'
 USERS_REQUEST = 'users_request'
 PUBLIC_KEY_REQUEST = 'public_key_request'
+CODECS = 'codecs'
+CODEC = 'codec'
+REQUEST_ID = 'request_id'
+PUBLIC_KEY_UPDATE = 'public_key_update'
+PUBLIC_KEY_CHECK = 'public_key_check'
+USERS_VERSION = 'users_version'
+REMOVED = 'removed'
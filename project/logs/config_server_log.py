@@ -1,7 +1,9 @@
 import os
 import sys
+import atexit
 import logging
-import logging.handlers
+import queue
+from logs.queue_log import BoundedQueueHandler, BatchingQueueListener, BatchedRotatingFileHandler
 
 logger = logging.getLogger('server')
 
@@ -12,7 +14,7 @@ formatter_stdout = logging.Formatter('%(message)s')
 path = os.path.dirname(os.path.abspath(__file__))
 path = os.path.join(path, 'server.log')
 
-fh = logging.handlers.TimedRotatingFileHandler(path, encoding='utf8', interval=1, when='H')
+fh = BatchedRotatingFileHandler(path, encoding='utf8', interval=1, when='H')
 fh.setLevel(logging.DEBUG)
 fh.setFormatter(formatter)
 
@@ -20,10 +22,19 @@ sh = logging.StreamHandler(sys.stdout)
 sh.setLevel(logging.INFO)
 sh.setFormatter(formatter_stdout)
 
-logger.addHandler(fh)
-logger.addHandler(sh)
+# Обработчики работают в потоке listener: форматирование уже выполнено
+# в QueueHandler, ротация и запись на диск не задерживают поток сервера.
+QUEUE_SIZE = 10000
+
+queue_handler = BoundedQueueHandler(queue.Queue(QUEUE_SIZE))
+listener = BatchingQueueListener(queue_handler, fh, sh, respect_handler_level=True)
+
+logger.addHandler(queue_handler)
 logger.setLevel(logging.DEBUG)
 
+listener.start()
+atexit.register(listener.stop)
+
 if __name__ == '__main__':
     logger.info('Тест работы кофигуратора логирования')
     logger.critical('Тест работы кофигуратора логирования')
@@ -1,7 +1,9 @@
 """Декораторы логирования """
 
-import traceback
+import sys
 import logging
+import functools
+import traceback
 
 
 TRACE = traceback.format_stack()
@@ -11,16 +13,52 @@ if 'client' in TRACE[0]:
 else:
     LOGGER = logging.getLogger('server')
 
+# Трассировка вызовов идёт в дочерние логгеры <client|server>.trace.<модуль>,
+# поэтому её можно включать и выключать отдельно от остального журнала.
+TRACE_LOGGER = LOGGER.getChild('trace')
+
+_callers = {}
+
+
+def _caller(frame):
+    """Имя вызывающей функции; строка кэшируется по объекту кода."""
+    code = frame.f_code
+    name = _callers.get(code)
+    if name is None:
+        name = f"{frame.f_globals.get('__name__')}.{getattr(code, 'co_qualname', code.co_name)}"
+        _callers[code] = name
+    return name
+
+
+def set_tracing(enabled, module=None):
+    """
+    Включить или выключить трассировку вызовов во время работы.
+
+    module - имя модуля декорированных функций (например, 'utils');
+    без него переключается трассировка всех модулей.
+    """
+    logger = TRACE_LOGGER.getChild(module) if module else TRACE_LOGGER
+    logger.setLevel(logging.DEBUG if enabled else logging.INFO)
+
 
 def log(func_to_log):
-    """Функция декоратор"""
+    """
+    Функция декоратор.
+
+    Пишет вызов функции на уровне DEBUG. Если уровень выключен, обёртка
+    ограничивается одной проверкой isEnabledFor: ни стек, ни строка
+    сообщения не строятся.
+    """
+    logger = TRACE_LOGGER.getChild(func_to_log.__module__)
+    name = func_to_log.__name__
+    module = func_to_log.__module__
 
+    @functools.wraps(func_to_log)
     def wrap(*args, **kwargs):
         res = func_to_log(*args, **kwargs)
-        trace = traceback.format_stack()
-        LOGGER.debug(f' Вызвана функция {func_to_log.__name__} c аргументами {args}, {kwargs}'
-                     f' из модуля {func_to_log.__module__}.'
-                     f' Вызов из функции {trace[0].split()[-1]}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(' Вызвана функция %s c аргументами %s, %s из модуля %s. Вызов из функции %s',
+                         name, args, kwargs, module, _caller(sys._getframe(1)))
         return res
 
     return wrap
@@ -0,0 +1,129 @@
+"""Асинхронная запись журнала через очередь."""
+
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладёт записи в ограниченную очередь и никогда не блокирует.
+
+    Если поток записи не успевает и очередь заполнена, запись отбрасывается,
+    а счётчик dropped увеличивается.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.lock_dropped = threading.Lock()
+
+    def prepare(self, record):
+        """
+        Подставить аргументы в сообщение в потоке вызова, не копируя запись:
+        окончательное форматирование выполняет поток записи.
+        """
+        if record.exc_info:
+            return super().prepare(record)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock_dropped:
+                self.dropped += 1
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    Поток записи журнала.
+
+    Записи передаются обработчикам без сброса буферов; сброс выполняется,
+    когда очередь опустела, то есть одной записью на диск на пачку. Пустую
+    очередь поток проверяет раз в interval секунд, а не ждёт на ней: иначе
+    каждая запись будила бы его и отнимала GIL у потока сервера.
+    Здесь же сообщается о записях, отброшенных при переполнении очереди.
+    """
+
+    def __init__(self, queue_handler, *handlers, respect_handler_level=False, interval=0.05):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=respect_handler_level)
+        self.queue_handler = queue_handler
+        self.interval = interval
+        self.reported_dropped = 0
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                if not block:
+                    raise
+            self.flush()
+            time.sleep(self.interval)
+
+    def enqueue_sentinel(self):
+        """
+        Поставить в очередь признак остановки. Пока поток жив, он освобождает
+        место; если поток уже завершился, ждать места в полной очереди некому.
+        """
+        while self._thread.is_alive():
+            try:
+                self.queue.put(self._sentinel, timeout=self.interval)
+                return
+            except queue.Full:
+                pass
+
+    def handle(self, record):
+        """
+        Передать запись обработчикам. Ошибка одного обработчика не должна
+        останавливать поток записи: она передаётся в его handleError.
+        """
+        record = self.prepare(record)
+        for handler in self.handlers:
+            if self.respect_handler_level and record.levelno < handler.level:
+                continue
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+    def flush(self):
+        """Сообщить об отброшенных записях и сбросить буферы обработчиков."""
+        dropped = self.queue_handler.dropped
+        if dropped != self.reported_dropped:
+            record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       'Очередь журнала переполнена, потеряно записей: %d',
+                                       (dropped - self.reported_dropped,), None)
+            self.reported_dropped = dropped
+            self.handle(record)
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:
+                handler.handleError(None)
+
+    def stop(self):
+        """Записать всё, что осталось в очереди, и остановить поток."""
+        if self._thread is not None:
+            super().stop()
+            self.flush()
+
+
+class BatchedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Ротация по времени без сброса буфера файла после каждой записи."""
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
@@ -1,27 +1,37 @@
 import dis
+import inspect
+
+
+def get_instructions(clsdict):
+    """
+    Bytecode instructions of the functions defined in a class body,
+    including static and class methods. Other attributes (docstrings,
+    constants) are not code and are skipped.
+    """
+    for value in clsdict.values():
+        value = getattr(value, '__func__', value)
+        if inspect.isfunction(value):
+            yield from dis.get_instructions(value)
 
 
 class ServerValidator(type):
     """
     Check the server class for the absence of the client method connect
-    and for the correct initialization of the socket.
+    and for the correct initialization of the socket. Methods inherited
+    from checked base servers are checked together with the class's own.
     """
     def __init__(cls, clsname, bases, clsdict):
         methods = []
         attrs = []
-        for func in clsdict:
-            try:
-                ret = dis.get_instructions(clsdict[func])
-            except TypeError:
-                pass
-            else:
-                for i in ret:
-                    if i.opname == 'LOAD_GLOBAL':
-                        if i.argval not in methods:
-                            methods.append(i.argval)
-                    elif i.opname == 'LOAD_ATTR':
-                        if i.argval not in attrs:
-                            attrs.append(i.argval)
+        namespaces = [clsdict] + [vars(base) for base in cls.__mro__[1:] if isinstance(base, ServerValidator)]
+        for namespace in namespaces:
+            for i in get_instructions(namespace):
+                if i.opname == 'LOAD_GLOBAL':
+                    if i.argval not in methods:
+                        methods.append(i.argval)
+                elif i.opname == 'LOAD_ATTR':
+                    if i.argval not in attrs:
+                        attrs.append(i.argval)
         if 'connect' in methods:
             raise TypeError('Использование метода connect недопустимо в серверном классе')
         if not ('SOCK_STREAM' in attrs and 'AF_INET' in attrs):
@@ -36,16 +46,10 @@ class ClientValidator(type):
     """
     def __init__(cls, clsname, bases, clsdict):
         methods = []
-        for func in clsdict:
-            try:
-                ret = dis.get_instructions(clsdict[func])
-            except TypeError:
-                pass
-            else:
-                for i in ret:
-                    if i.opname == 'LOAD_GLOBAL':
-                        if i.argval not in methods:
-                            methods.append(i.argval)
+        for i in get_instructions(clsdict):
+            if i.opname == 'LOAD_GLOBAL':
+                if i.argval not in methods:
+                    methods.append(i.argval)
         for command in ('accept', 'listen', 'socket'):
             if command in methods:
                 raise TypeError('В классе обнаружено использование запрещённого метода')
@@ -6,8 +6,9 @@ import os
 import re
 import sys
 import configparser
-from server.server_database import ServerDB
-from server.core import Server
+from constants import OUTBOUND_HIGH_WATERMARK, OUTBOUND_LOW_WATERMARK, OUTBOUND_POLICY
+from server.storage import create_storage
+from server.core import Server, AsyncServer
 from server.main_window import MainWindow
 
 from PyQt5.QtWidgets import QApplication
@@ -43,14 +44,20 @@ def run_server():
     """Start server application."""
     config = get_params()
 
-    db_path = os.path.join(config['SETTINGS']['Database_path'],
-                           config['SETTINGS']['Database_file'])
-
-    database = ServerDB(db_path)
-
-    server = Server(config['SETTINGS']['listen_address'],
-                    int(config['SETTINGS']['port']),
-                    database)
+    database = create_storage(config['SETTINGS'])
+
+    if config['SETTINGS'].get('server_core') == 'asyncio':
+        server_class = AsyncServer
+    else:
+        server_class = Server
+    server = server_class(config['SETTINGS']['listen_address'],
+                          int(config['SETTINGS']['port']),
+                          database,
+                          high_watermark=config['SETTINGS'].getint('outbound_high_watermark',
+                                                                   OUTBOUND_HIGH_WATERMARK),
+                          low_watermark=config['SETTINGS'].getint('outbound_low_watermark',
+                                                                  OUTBOUND_LOW_WATERMARK),
+                          overflow_policy=config['SETTINGS'].get('outbound_policy', OUTBOUND_POLICY))
     server.daemon = True
     server.start()
 
@@ -60,6 +67,9 @@ def run_server():
 
     server_app.exec_()
 
+    server.shutdown()
+    database.close()
+
 
 if __name__ == '__main__':
     logger.info('Запуск сервера')
@@ -0,0 +1,131 @@
+"""Модели таблиц окон администратора: загрузка страницами и обновление по событиям сервера."""
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
+from datetime import datetime
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, pyqtSignal
+
+PAGE_SIZE = 200
+
+
+class ServerEvents(QObject):
+    """
+    Наблюдатель Server (Server.subscribe), пересылающий вход и выход
+    пользователей в сигналы Qt. Сигналы испускаются в потоке сервера
+    и доставляются в поток интерфейса через очередь событий Qt.
+    """
+    connected = pyqtSignal(str, str, int, object)
+    disconnected = pyqtSignal(str)
+
+    def client_connected(self, account_name, ip_address, port, time_connect):
+        self.connected.emit(account_name, ip_address, port, time_connect)
+
+    def client_disconnected(self, account_name):
+        self.disconnected.emit(account_name)
+
+
+class PagedTableModelMeta(type(QAbstractTableModel), ABCMeta):
+    """Метакласс моделей Qt с абстрактными методами."""
+
+
+class PagedTableModel(QAbstractTableModel, metaclass=PagedTableModelMeta):
+    """
+    Таблица, упорядоченная по имени пользователя в первом столбце.
+    Строки читаются из базы страницами по page_size, когда представление
+    прокручено к концу загруженного (canFetchMore/fetchMore).
+    """
+    HEADERS = ()
+
+    def __init__(self, database, page_size=PAGE_SIZE):
+        super().__init__()
+        self.database = database
+        self.page_size = page_size
+        self.rows = []
+        self.keys = []
+        self.exhausted = False
+
+    @abstractmethod
+    def load_page(self, after, limit):
+        """Строки базы с именем после after, не больше limit."""
+
+    def reload(self):
+        """Сбросить загруженные строки; представление загрузит первую страницу заново."""
+        self.beginResetModel()
+        self.rows = []
+        self.keys = []
+        self.exhausted = False
+        self.endResetModel()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        page = self.load_page(self.keys[-1] if self.keys else None, self.page_size)
+        self.exhausted = len(page) < self.page_size
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(tuple(row) for row in page)
+            self.keys.extend(row[0] for row in page)
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        value = self.rows[index.row()][index.column()]
+        if isinstance(value, datetime):
+            return str(value.replace(microsecond=0))
+        return str(value)
+
+
+class ActiveClientsModel(PagedTableModel):
+    """
+    Пользователи в сети. После загрузки меняется только по событиям
+    ServerEvents: вход добавляет или обновляет строку, выход удаляет её.
+    Вход пользователя за пределами загруженных страниц пропускается:
+    он придёт со следующей страницей.
+    """
+    HEADERS = ('Имя Клиента', 'IP Адрес', 'Порт', 'Время подключения')
+
+    def load_page(self, after, limit):
+        return self.database.active_clients_list(after=after, limit=limit)
+
+    def client_connected(self, account_name, ip_address, port, time_connect):
+        row = (account_name, ip_address, port, time_connect)
+        position = bisect_left(self.keys, account_name)
+        if position < len(self.keys) and self.keys[position] == account_name:
+            self.rows[position] = row
+            self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.HEADERS) - 1))
+        elif position < len(self.keys) or self.exhausted:
+            self.beginInsertRows(QModelIndex(), position, position)
+            self.rows.insert(position, row)
+            self.keys.insert(position, account_name)
+            self.endInsertRows()
+
+    def client_disconnected(self, account_name):
+        position = bisect_left(self.keys, account_name)
+        if position < len(self.keys) and self.keys[position] == account_name:
+            self.beginRemoveRows(QModelIndex(), position, position)
+            del self.rows[position]
+            del self.keys[position]
+            self.endRemoveRows()
+
+
+class StatModel(PagedTableModel):
+    """Статистика сообщений по пользователям."""
+    HEADERS = ('Имя Клиента', 'Последний раз входил', 'Сообщений отправлено', 'Сообщений получено')
+
+    def load_page(self, after, limit):
+        return self.database.message_history(after=after, limit=limit)
@@ -1,20 +1,49 @@
 """Сервер."""
+import asyncio
 import binascii
 import socket
 import logging
-import select
+import selectors
 import os
 import hmac
 import configparser
 from descriptors import ServerPort
 import threading
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from constants import *
-from utils import get_message, send_message
+from utils import read_messages, get_framer, select_codec, key_fingerprint, valid_public_key
 from metaclasses import ServerValidator
+from server.outbound import OutboundQueue
 
 logger = logging.getLogger('server')
 
+AWAIT_PRESENCE = 'await_presence'
+AWAIT_DIGEST = 'await_digest'
+AUTHENTICATED = 'authenticated'
+
+
+class ClientConnection:
+    """
+    Состояние подключения: буфер сборки входящих, буфер исходящих данных
+    и этап авторизации AWAIT_PRESENCE -> AWAIT_DIGEST -> AUTHENTICATED.
+    """
+
+    def __init__(self, sock, outbound):
+        self.sock = sock
+        self.framer = get_framer(sock)
+        self.outbound = outbound
+        self.events = selectors.EVENT_READ
+        self.account_name = None
+        self.state = AWAIT_PRESENCE
+        self.presence = None
+        self.digest = None
+        self.deadline = None
+        self.codec = None
+
 
 class Server(threading.Thread, metaclass=ServerValidator):
     port = ServerPort()
@@ -22,127 +51,292 @@ class Server(threading.Thread, metaclass=ServerValidator):
     config = configparser.ConfigParser()
     config.read('server.ini')
 
-    def __init__(self, address, port, db):
-        self.clients = []
+    def __init__(self, address, port, db,
+                 high_watermark=OUTBOUND_HIGH_WATERMARK,
+                 low_watermark=OUTBOUND_LOW_WATERMARK,
+                 overflow_policy=OUTBOUND_POLICY,
+                 handshake_timeout=HANDSHAKE_TIMEOUT):
+        self.clients = dict()
         self.user_names = dict()
+        self.handshakes = deque()
+        self.commands = deque()
+        self.commands_lock = threading.Lock()
+        self.selector = None
+        self.wakeup = None
+        self.running = True
         self.address = address
         self.port = port
         self.db = db
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.overflow_policy = overflow_policy
+        self.handshake_timeout = handshake_timeout
+        self.observers = []
         super().__init__()
 
+    def subscribe(self, observer):
+        """
+        Подписать наблюдателя на вход и выход пользователей. У наблюдателя
+        вызываются client_connected(имя, адрес, порт, время входа) и
+        client_disconnected(имя) из потока сервера, после записи в базу.
+        """
+        self.observers.append(observer)
+
+    def call_soon(self, callback, *args):
+        """
+        Выполнить callback(*args) в потоке сервера. Единственный способ
+        для других потоков (окон интерфейса) изменить clients, user_names
+        или соединения: сам вызов только ставит команду в очередь и будит
+        цикл сервера.
+        """
+        with self.commands_lock:
+            self.commands.append((callback, args))
+            self.wake()
+
+    def wake(self):
+        """Прервать ожидание select в цикле сервера (под commands_lock)."""
+        if self.wakeup is not None:
+            try:
+                self.wakeup[1].send(b'\0')
+            except BlockingIOError:
+                pass
+
+    def run_command(self, callback, args):
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception(f'Ошибка при выполнении команды {callback.__name__}')
+
+    def run_commands(self):
+        """Выполнить команды, поставленные call_soon."""
+        while self.commands:
+            self.run_command(*self.commands.popleft())
+
+    def read_wakeup(self, sock, mask):
+        try:
+            sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def notify(self, event, *args):
+        for observer in self.observers:
+            try:
+                getattr(observer, event)(*args)
+            except Exception:
+                logger.exception(f'Ошибка наблюдателя при событии {event}')
+
     def preparation_presence_message(self, client, message):
         """Подготовка и отправка presence ответа."""
         if USER in message:
             logger.debug(f'Получено presence сообщение от {client.getpeername()}')
             if message[USER][ACCOUNT_NAME] in self.user_names:
-                send_message(client, {RESPONSE: 400,
+                self.send_to(client, {RESPONSE: 400,
                                       ERROR: f'Имя {message[USER][ACCOUNT_NAME]} уже занято'})
-                self.clients.remove(client)
-                client.close()
+                self.remove_client(client)
             elif not self.db.check_user(message[USER][ACCOUNT_NAME]):
-                send_message(client, {RESPONSE: 400,
+                self.send_to(client, {RESPONSE: 400,
                                       ERROR: f'Пользователь {message[USER][ACCOUNT_NAME]} не зарегистрирован'})
-                self.clients.remove(client)
-                client.close()
+                self.remove_client(client)
+            elif not valid_public_key(message[USER].get(PUBLIC_KEY)):
+                logger.error(f'Пользователь {message[USER][ACCOUNT_NAME]} прислал некорректный публичный ключ')
+                self.send_to(client, {RESPONSE: 400,
+                                      ERROR: 'Некорректный публичный ключ'})
+                self.remove_client(client)
             else:
                 random_str = binascii.hexlify(os.urandom(64))
                 hash = hmac.new(self.db.get_hash(message[USER][ACCOUNT_NAME]), random_str, 'MD5')
-                digest = hash.digest()
-                send_message(client, {RESPONSE: 511,
+                conn = self.clients[client]
+                conn.state = AWAIT_DIGEST
+                conn.digest = hash.digest()
+                conn.presence = message[USER]
+                if CODECS in message and not conn.framer.legacy:
+                    conn.codec = select_codec(message[CODECS])
+                self.set_deadline(client, conn)
+                self.send_to(client, {RESPONSE: 511,
                                       ALERT: random_str.decode('ascii')})
-                ans = get_message(client)
-                client_digest = binascii.a2b_base64(ans[ALERT])
-                if RESPONSE in ans and ans[RESPONSE] == 511 and \
-                        hmac.compare_digest(digest, client_digest):
-                    self.user_names[message[USER][ACCOUNT_NAME]] = client
-                    presence_alert = f'Добро пожаловать в чат, {message[USER][ACCOUNT_NAME]}!\n'
-                    send_message(client, {RESPONSE: 200, ALERT: presence_alert})
-                    client_ip, client_port = client.getpeername()
-                    self.db.client_login(message[USER][ACCOUNT_NAME],
-                                         client_ip,
-                                         client_port,
-                                         message[USER][PUBLIC_KEY])
-                else:
-                    send_message(client, {RESPONSE: 400,
-                                          ERROR: 'Неверный пароль'})
-                    self.clients.remove(client)
-                    client.close()
         else:
             logger.error(f'Получена некорректная информация о имени пользователя. Соединение не установлено')
-            send_message(client, {RESPONSE: 400,
+            self.send_to(client, {RESPONSE: 400,
                                   ERROR: 'Некорректная информация о имени пользователя. Соединение не установлено'})
 
+    def preparation_digest_message(self, client, message):
+        """Проверка ответа клиента на 511 и завершение авторизации."""
+        conn = self.clients[client]
+        account_name = conn.presence[ACCOUNT_NAME]
+        if RESPONSE in message and message[RESPONSE] == 511 and ALERT in message and \
+                hmac.compare_digest(conn.digest, binascii.a2b_base64(message[ALERT])):
+            if account_name in self.user_names:
+                self.send_to(client, {RESPONSE: 400,
+                                      ERROR: f'Имя {account_name} уже занято'})
+                self.remove_client(client)
+                return
+            conn.state = AUTHENTICATED
+            conn.digest = None
+            self.user_names[account_name] = client
+            conn.account_name = account_name
+            presence_alert = f'Добро пожаловать в чат, {account_name}!\n'
+            if conn.codec is None:
+                self.send_to(client, {RESPONSE: 200, ALERT: presence_alert})
+            else:
+                self.send_to(client, {RESPONSE: 200, ALERT: presence_alert, CODEC: conn.codec.name})
+                conn.framer.codec = conn.codec
+                logger.debug(f'Для {account_name} выбран кодек {conn.codec.name}')
+            client_ip, client_port = client.getpeername()
+            if self.db.client_login(account_name,
+                                    client_ip,
+                                    client_port,
+                                    conn.presence[PUBLIC_KEY]):
+                self.send_public_key_update(account_name, conn.presence[PUBLIC_KEY])
+            self.notify('client_connected', account_name, client_ip, client_port, datetime.now())
+            offline_messages = self.db.peek_offline_messages(account_name)
+            if offline_messages:
+                logger.debug(f'Доставка {len(offline_messages)} отложенных сообщений для {account_name}')
+                if self.send_batch(client, [message for _, message in offline_messages], required=True):
+                    self.db.ack_offline_messages(account_name, offline_messages[-1][0])
+        else:
+            self.send_to(client, {RESPONSE: 400,
+                                  ERROR: 'Неверный пароль'})
+            self.remove_client(client)
+
+    def set_deadline(self, client, conn):
+        """Дать клиенту handshake_timeout секунд на следующий шаг авторизации."""
+        conn.deadline = time.monotonic() + self.handshake_timeout
+        self.handshakes.append((conn.deadline, client))
+
+    def expire_handshakes(self):
+        """
+        Отключить клиентов, не завершивших шаг авторизации вовремя: не
+        приславших PRESENCE после подключения или не ответивших на 511.
+        """
+        now = time.monotonic()
+        while self.handshakes and self.handshakes[0][0] <= now:
+            deadline, client = self.handshakes.popleft()
+            conn = self.clients.get(client)
+            if conn is not None and conn.state != AUTHENTICATED and conn.deadline == deadline:
+                logger.error(f'Клиент {client.getpeername()} не завершил авторизацию')
+                self.remove_client(client)
+
     def preparation_send_message(self, client, message):
         """Обработка и отправка сообщения от клиента к клиенту."""
         if FROM in message and TO in message and MESSAGE_TEXT in message:
             logger.debug(f'Получено сообщение от пользователя{message[FROM]}: {message[MESSAGE_TEXT]}')
+            relayed = message
+            if REQUEST_ID in message:
+                relayed = {key: value for key, value in message.items() if key != REQUEST_ID}
             if message[TO] in self.user_names:
-                send_message(self.user_names[message[TO]], message)
-                send_message(client, {RESPONSE: 200})
+                self.send_to(self.user_names[message[TO]], relayed)
+                self.reply(client, message, {RESPONSE: 200})
+                self.db.modification_action_history(message[FROM], message[TO])
+            elif self.db.check_user(message[TO]):
+                self.db.store_offline_message(message[TO], relayed)
+                self.reply(client, message, {RESPONSE: 200})
                 self.db.modification_action_history(message[FROM], message[TO])
             else:
-                send_message(client,
-                             {RESPONSE: 400,
-                              ERROR: f'Невозможно доставить сообщение пользователь {message[TO]} не в сети'})
+                self.reply(client, message,
+                           {RESPONSE: 400,
+                            ERROR: f'Невозможно доставить сообщение пользователь {message[TO]} не зарегистрирован'})
         else:
             logger.error(f'Получена некорректная информация о имени пользователя. Соединение не установлено')
-            send_message(client, {RESPONSE: 400,
-                                  ERROR: 'Получено некорректное сообщение'})
+            self.reply(client, message, {RESPONSE: 400,
+                                         ERROR: 'Получено некорректное сообщение'})
 
     def preparation_exit_message(self, client, message):
         """Обработка сообщения о выходе"""
         if ACCOUNT_NAME in message:
             logger.debug(f'Получено exit сообщение от {client.getpeername()}')
-            send_message(client, {ACTION: EXIT})
-            self.db.client_logout(message[ACCOUNT_NAME])
-            self.clients.remove(client)
-            client.close()
-            del self.user_names[message[ACCOUNT_NAME]]
+            self.send_to(client, {ACTION: EXIT})
+            self.remove_client(client)
         else:
             logger.error(f'Получена некорректная информация о имени пользователя.')
-            send_message(client, {RESPONSE: 400,
-                                  ERROR: 'Получено некорректное сообщение'})
+            self.reply(client, message, {RESPONSE: 400,
+                                         ERROR: 'Получено некорректное сообщение'})
 
     def preparation_contacts_list(self, client, message):
         """Обработка сообщения получения списка контактов."""
         if USER in message:
             contacts = self.db.contacts_list(message[USER])
-            send_message(client, {RESPONSE: 202, ALERT: contacts})
+            self.reply(client, message, {RESPONSE: 202, ALERT: contacts})
 
     def preparation_add_contact(self, client, message):
         """Обработка сообщения о добавления пользователя в списко контактов."""
         if USER in message and CONTACT in message:
-            if message[CONTACT] in self.db.clients_list():
+            if self.db.check_user(message[CONTACT]):
                 self.db.add_contact(message[USER], message[CONTACT])
-                send_message(client, {RESPONSE: 200,
-                                      ALERT: f'Пользователь {message[CONTACT]} добавлен в список контактов'})
+                self.reply(client, message, {RESPONSE: 200,
+                                             ALERT: f'Пользователь {message[CONTACT]} добавлен в список контактов'})
+            else:
+                self.reply(client, message, {RESPONSE: 400,
+                                             ERROR: f'Пользователь {message[CONTACT]} не зарегистрирован'})
 
     def preparation_del_contact(self, client, message):
         """Обработка сообщения об удалении пользователя из списко контактов."""
         if USER in message and CONTACT in message:
             self.db.delete_contact(message[USER], message[CONTACT])
-            send_message(client, {RESPONSE: 200,
-                                  ALERT: f'Пользователь {message[CONTACT]} удален из списка контактов'})
+            self.reply(client, message, {RESPONSE: 200,
+                                         ALERT: f'Пользователь {message[CONTACT]} удален из списка контактов'})
 
     def preparation_user_request(self, client, message):
+        """
+        Список пользователей. Если клиент передал USERS_VERSION, известную
+        серверу, отправляются только изменения после неё: ALERT - добавленные,
+        REMOVED - удалённые. Иначе ALERT - полный список. В обоих случаях
+        USERS_VERSION - текущая версия.
+        """
         if ACCOUNT_NAME in message:
-            answer = {RESPONSE: 202,
-                      ALERT: self.db.clients_list()}
-            send_message(client, answer)
+            version = message.get(USERS_VERSION)
+            current = self.db.users_version()
+            if isinstance(version, int) and 0 < version <= current:
+                added, removed, current = self.db.users_changes(version)
+                answer = {RESPONSE: 202, ALERT: added, REMOVED: removed, USERS_VERSION: current}
+            else:
+                answer = {RESPONSE: 202, ALERT: self.db.clients_list(), USERS_VERSION: current}
+            self.reply(client, message, answer)
+
+    def send_public_key_update(self, account_name, pub_key):
+        """Сообщить пользователям в сети, что пользователь сменил ключ."""
+        logger.debug(f'Пользователь {account_name} сменил публичный ключ')
+        update = {ACTION: PUBLIC_KEY_UPDATE, TIME: time.time(),
+                  ACCOUNT_NAME: account_name, PUBLIC_KEY: pub_key}
+        for name, client in list(self.user_names.items()):
+            if name != account_name:
+                self.send_to(client, update)
+
+    def preparation_public_key_check(self, client, message):
+        """
+        Сверка кэша ключей клиента. USER - словарь имя: отпечаток ключа;
+        в ответе - актуальные ключи тех, чей отпечаток не совпал
+        (None, если ключа больше нет).
+        """
+        if USER in message and isinstance(message[USER], dict):
+            changed = dict()
+            for name, fingerprint in message[USER].items():
+                user = self.db.get_user(name)
+                pub_key = user.pub_key if user else None
+                if not pub_key or key_fingerprint(pub_key) != fingerprint:
+                    changed[name] = pub_key
+            self.reply(client, message, {RESPONSE: 202, ALERT: changed})
+        else:
+            self.reply(client, message, {RESPONSE: 400,
+                                         ERROR: 'Получено некорректное сообщение'})
 
     def preparation_public_key_request(self, client, message):
         pub_key = self.db.get_pubkey(message[ACCOUNT_NAME])
         if pub_key:
-            send_message(client, {RESPONSE: 511, ALERT: pub_key})
+            self.reply(client, message, {RESPONSE: 511, ALERT: pub_key})
         else:
-            send_message(client, {RESPONSE: 400,
-                                  ERROR: 'Нет публичного ключа для данного пользователя'})
+            self.reply(client, message, {RESPONSE: 400,
+                                         ERROR: 'Нет публичного ключа для данного пользователя'})
 
     def process_client_message(self, message, client):
         """Обработчик сообщений от клиентов."""
         logger.debug(f'Получено сообщение от {client.getpeername()}: {message}')
-        if ACTION in message and TIME in message:
-            if message[ACTION] == PRESENCE:
+        state = self.clients[client].state
+        if state == AWAIT_DIGEST:
+            self.preparation_digest_message(client, message)
+        elif ACTION in message and TIME in message:
+            if state != AUTHENTICATED and message[ACTION] != PRESENCE:
+                self.reply(client, message, {RESPONSE: 400, ERROR: 'Требуется авторизация'})
+            elif message[ACTION] == PRESENCE:
                 self.preparation_presence_message(client, message)
             elif message[ACTION] == MESSAGE:
                 self.preparation_send_message(client, message)
@@ -158,50 +352,399 @@ class Server(threading.Thread, metaclass=ServerValidator):
                 self.preparation_user_request(client, message)
             elif message[ACTION] == PUBLIC_KEY_REQUEST:
                 self.preparation_public_key_request(client, message)
+            elif message[ACTION] == PUBLIC_KEY_CHECK:
+                self.preparation_public_key_check(client, message)
         else:
             logger.error(f'Получено неверное сообщение. Соединение не установлено')
-            send_message(client, {RESPONSE: 400, ERROR: 'Bad request'})
+            self.reply(client, message, {RESPONSE: 400, ERROR: 'Bad request'})
+
+    def reply(self, client, request, answer):
+        """Ответить на запрос, вернув его REQUEST_ID, если клиент его передал."""
+        if REQUEST_ID in request:
+            answer[REQUEST_ID] = request[REQUEST_ID]
+        self.send_to(client, answer)
+
+    def send_to(self, client, message):
+        """Поставить сообщение в буфер клиента и сразу попытаться его отправить."""
+        self.send_batch(client, (message,))
+
+    def send_batch(self, client, messages, required=False):
+        """
+        Отправить несколько сообщений одной записью в сокет. required -
+        сообщения нельзя отбросить при переполнении буфера (см. OutboundQueue.push).
+        True - сообщения приняты в буфер клиента.
+        """
+        conn = self.clients.get(client)
+        if conn is None:
+            return False
+        if not conn.outbound.push(b''.join(conn.framer.pack(message) for message in messages), required):
+            logger.warning(f'Клиент {conn.account_name or client} не успевает принимать сообщения, '
+                           f'соединение закрыто')
+            self.remove_client(client)
+            return False
+        try:
+            self.flush(conn)
+        except OSError:
+            pass
+        finally:
+            self.update_events(conn)
+        return True
+
+    def flush(self, conn):
+        """Отправить из буфера столько данных, сколько примет сокет."""
+        if conn.outbound:
+            conn.outbound.consume(conn.sock.send(conn.outbound.buffer))
+
+    def update_events(self, conn):
+        """Подписаться на готовность к записи, только пока буфер не пуст."""
+        events = selectors.EVENT_READ
+        if conn.outbound:
+            events |= selectors.EVENT_WRITE
+        if events != conn.events and conn.sock in self.clients:
+            self.selector.modify(conn.sock, events, self.service_connection)
+            conn.events = events
+
+    def remove_client(self, client):
+        """Закрыть соединение и отметить выход пользователя."""
+        conn = self.clients.pop(client, None)
+        if conn is None:
+            return
+        self.release_account(client, conn)
+        conn.outbound.close()
+        self.selector.unregister(client)
+        client.close()
+
+    def release_account(self, client, conn):
+        """Освободить имя пользователя закрываемого соединения."""
+        if conn.account_name and self.user_names.get(conn.account_name) is client:
+            del self.user_names[conn.account_name]
+            self.db.client_logout(conn.account_name)
+            self.notify('client_disconnected', conn.account_name)
+
+    def remove_user(self, account_name):
+        """
+        Удалить пользователя. Если он в сети, соединение закрывается
+        раньше удаления из базы: выход записывается в историю, а
+        наблюдатели получают client_disconnected.
+        """
+        client = self.user_names.get(account_name)
+        if client is not None:
+            self.remove_client(client)
+        self.db.remove_user(account_name)
+
+    def create_outbound(self):
+        return OutboundQueue(self.high_watermark, self.low_watermark, self.overflow_policy)
 
     def create_socket(self):
         """Создание соккета."""
         transport = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         transport.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         transport.bind((self.address, self.port))
-        transport.settimeout(0.2)
+        transport.setblocking(False)
 
         self.transport = transport
-        self.transport.listen(REQUEST_NUMBER)
+        self.transport.listen(socket.SOMAXCONN)
+
+    def accept_connections(self, sock, mask):
+        """Принять все ожидающие подключения."""
+        while True:
+            try:
+                client, address = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as err:
+                logger.error(f'Ошибка при приёме подключения: {err}')
+                return
+            logger.debug(f'Попытка подключения от {address}')
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self.clients[client] = ClientConnection(client, self.create_outbound())
+            self.set_deadline(client, conn)
+            self.selector.register(client, selectors.EVENT_READ, self.service_connection)
+
+    def service_connection(self, client, mask):
+        """Обработать готовность сокета клиента к чтению или записи."""
+        if mask & selectors.EVENT_READ:
+            self.read_client(client)
+        if mask & selectors.EVENT_WRITE and client in self.clients:
+            self.write_client(client)
+
+    def read_client(self, client):
+        """Прочитать сокет и обработать все полностью принятые сообщения."""
+        try:
+            for message in read_messages(client):
+                self.process_client_message(message, client)
+                if client not in self.clients:
+                    break
+        except (BlockingIOError, InterruptedError):
+            pass
+        except Exception:
+            conn = self.clients.get(client)
+            if conn is not None:
+                logger.error(f'Клиент {conn.account_name or client} отключился от сервера')
+                self.remove_client(client)
+
+    def write_client(self, client):
+        """Дописать в сокет накопленные исходящие данные."""
+        conn = self.clients[client]
+        try:
+            self.flush(conn)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            logger.error(f'Не удалось отправить данные клиенту {conn.account_name or client}')
+            self.remove_client(client)
+            return
+        self.update_events(conn)
+
+    def next_deadline(self):
+        """Сколько секунд осталось до ближайшей плановой задачи (None - задач нет)."""
+        deadlines = []
+        if self.handshakes:
+            deadlines.append(self.handshakes[0][0])
+        flush_deadline = self.db.flush_deadline()
+        if flush_deadline is not None:
+            deadlines.append(flush_deadline)
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.monotonic(), 0)
+
+    def maintenance(self):
+        """Плановые задачи: таймауты авторизации и запись статистики."""
+        self.expire_handshakes()
+        self.db.flush_action_history_if_due()
+
+    def close_connections(self):
+        """Отключить всех клиентов и записать накопленную статистику."""
+        for client in list(self.clients):
+            self.remove_client(client)
+        self.db.flush_action_history()
+
+    def shutdown(self, timeout=5):
+        """Остановить цикл сервера и дождаться его завершения."""
+        self.running = False
+        with self.commands_lock:
+            self.wake()
+        self.join(timeout)
 
     def run(self):
         """Основной цикл работы сервера."""
         self.create_socket()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.transport, selectors.EVENT_READ, self.accept_connections)
+        wakeup = socket.socketpair()
+        for sock in wakeup:
+            sock.setblocking(False)
+        self.selector.register(wakeup[0], selectors.EVENT_READ, self.read_wakeup)
+        with self.commands_lock:
+            self.wakeup = wakeup
+        while self.running:
+            self.run_commands()
+            for key, mask in self.selector.select(self.next_deadline()):
+                callback = key.data
+                callback(key.fileobj, mask)
+            self.maintenance()
+        self.run_commands()
+        self.close_connections()
+        with self.commands_lock:
+            self.wakeup = None
+        for sock in wakeup:
+            sock.close()
+        self.selector.close()
+        self.transport.close()
+
+
+class StreamClient:
+    """
+    Соединение asyncio с интерфейсом сокета, который ожидают обработчики.
+    Методы можно вызывать из любого потока: запись и закрытие
+    передаются в цикл событий. close() закрывает соединение после
+    отправки всего, что уже поставлено в очередь (ответ с ошибкой перед
+    отключением доходит до клиента), но не дольше HANDSHAKE_TIMEOUT.
+    """
+
+    def __init__(self, reader, writer, loop, outbound):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.outbound = outbound
+        self.ready = asyncio.Event()
+        self.closing = False
+        self.write_task = None
+
+    def getpeername(self):
+        return self.writer.get_extra_info('peername')[:2]
+
+    def send(self, data, required=False):
+        self.loop.call_soon_threadsafe(self.enqueue, data, required)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.finish)
+
+    def enqueue(self, data, required=False):
+        if self.closing or self.writer.is_closing():
+            return
+        if not self.outbound.push(data, required):
+            logger.warning(f'Клиент {self.getpeername()} не успевает принимать сообщения, '
+                           f'соединение закрыто')
+            self.shutdown()
+            return
+        self.ready.set()
+
+    async def write_loop(self):
+        """
+        Передавать данные из очереди в транспорт по мере его освобождения;
+        после finish - дописать очередь и закрыть соединение.
+        """
+        try:
+            while not self.closing or self.outbound:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.outbound:
+                    data = bytes(self.outbound.buffer)
+                    self.outbound.consume(len(data))
+                    self.writer.write(data)
+                    await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.writer.close()
+            self.outbound.close()
+
+    def finish(self):
+        """Закрыть соединение, когда очередь будет отправлена."""
+        if self.closing:
+            return
+        self.closing = True
+        if self.write_task is None:
+            self.shutdown()
+            return
+        self.ready.set()
+        self.loop.call_later(HANDSHAKE_TIMEOUT, self.shutdown)
+
+    def shutdown(self):
+        """Закрыть соединение сразу, отбросив неотправленное."""
+        self.closing = True
+        if self.write_task is not None:
+            self.write_task.cancel()
+        self.writer.close()
+        self.outbound.close()
+
+
+class AsyncServer(Server):
+    """
+    Сервер на asyncio.start_server и потоках asyncio.
+
+    Цикл событий только читает и пишет сокеты. Обработчики preparation_*
+    и все обращения к базе выполняются в одном потоке-исполнителе, поэтому
+    clients, user_names и сессия ServerDB по-прежнему меняются из одного
+    потока, как и в Server.
+    """
+
+    def __init__(self, address, port, db, **outbound_limits):
+        super().__init__(address, port, db, **outbound_limits)
+        self.loop = None
+        self.serve_task = None
+        self.maintenance_task = None
+        self.connection_tasks = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='server-handlers')
+
+    def send_batch(self, client, messages, required=False):
+        """Передать сообщения в буфер записи потока клиента."""
+        conn = self.clients.get(client)
+        if conn is None:
+            return False
+        client.send(b''.join(conn.framer.pack(message) for message in messages), required)
+        return True
+
+    def remove_client(self, client):
+        """Закрыть соединение и отметить выход пользователя."""
+        conn = self.clients.pop(client, None)
+        if conn is None:
+            return
+        self.release_account(client, conn)
+        client.close()
+
+    def call_soon(self, callback, *args):
+        """Выполнить callback(*args) в потоке обработчиков (из любого потока)."""
+        with self.commands_lock:
+            if self.loop is None:
+                self.commands.append((callback, args))
+            else:
+                self.loop.call_soon_threadsafe(self.run_in_handlers, callback, args)
+
+    def run_in_handlers(self, callback, args):
+        self.loop.run_in_executor(self.executor, self.run_command, callback, args)
+
+    def register_client(self, client):
+        conn = self.clients[client] = ClientConnection(client, client.outbound)
+        self.set_deadline(client, conn)
+        return conn
+
+    def process_pending(self, client, conn):
+        """Обработать все собранные сообщения клиента."""
+        while conn.framer.pending and client in self.clients:
+            self.process_client_message(conn.framer.pop(), client)
+
+    async def handle_connection(self, reader, writer):
+        """Сопрограмма обслуживания одного подключения."""
+        client = StreamClient(reader, writer, self.loop, self.create_outbound())
+        client.write_task = self.loop.create_task(client.write_loop())
+        logger.debug(f'Попытка подключения от {client.getpeername()}')
+        self.connection_tasks.add(asyncio.current_task())
+        conn = await self.loop.run_in_executor(self.executor, self.register_client, client)
+        try:
+            while client in self.clients:
+                data = await reader.read(RECV_BUFFER_SIZE)
+                if not data:
+                    break
+                conn.framer.feed(data)
+                await self.loop.run_in_executor(self.executor, self.process_pending, client, conn)
+        except Exception:
+            logger.error(f'Клиент {conn.account_name or client.getpeername()} отключился от сервера')
+        finally:
+            await self.loop.run_in_executor(self.executor, self.remove_client, client)
+            self.connection_tasks.discard(asyncio.current_task())
+
+    async def maintenance_loop(self):
+        """Периодически выполнять плановые задачи в потоке обработчиков."""
         while True:
             try:
-                client, address = self.transport.accept()
-            except OSError:
-                pass
-            else:
-                logger.debug(f'Попытка подключения от {address}')
-                client.settimeout(5)
-                self.clients.append(client)
-            finally:
-                recv_data_lst = []
-                err_lst = []
-                try:
-                    recv_data_lst, send_data_lst, err_lst = select.select(self.clients, self.clients, err_lst, 0)
-                except OSError:
-                    pass
-
-                if recv_data_lst:
-                    for client_with_message in recv_data_lst:
-                        try:
-                            self.process_client_message(get_message(client_with_message), client_with_message)
-                        except:
-                            logger.error(f'Клиент уккп{client_with_message.getpeername()} '
-                                         f'отключился от сервера')
-                            for el in self.user_names:
-                                if self.user_names[el] == client_with_message:
-                                    self.db.client_logout(el)
-                                    del self.user_names[el]
-                                    break
-                            self.clients.remove(client_with_message)
+                timeout = await self.loop.run_in_executor(self.executor, self.next_deadline)
+                await asyncio.sleep(1 if timeout is None else min(timeout, 1))
+                await self.loop.run_in_executor(self.executor, self.maintenance)
+            except Exception:
+                logger.exception('Ошибка при выполнении плановых задач')
+                await asyncio.sleep(1)
+
+    async def serve(self):
+        with self.commands_lock:
+            self.loop = asyncio.get_running_loop()
+            self.serve_task = asyncio.current_task()
+            while self.commands:
+                self.run_in_handlers(*self.commands.popleft())
+        if not self.running:
+            return
+        self.maintenance_task = self.loop.create_task(self.maintenance_loop())
+        self.create_socket()
+        server = await asyncio.start_server(self.handle_connection, sock=self.transport)
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            self.maintenance_task.cancel()
+            await self.loop.run_in_executor(self.executor, self.close_connections)
+            if self.connection_tasks:
+                await asyncio.wait(self.connection_tasks, timeout=1)
+
+    def shutdown(self, timeout=5):
+        """Остановить цикл сервера и дождаться его завершения."""
+        self.running = False
+        with self.commands_lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.serve_task.cancel)
+        self.join(timeout)
+
+    def run(self):
+        """Основной цикл работы сервера."""
+        asyncio.run(self.serve())
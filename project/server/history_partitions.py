@@ -0,0 +1,40 @@
+"""
+История подключений по дням: отдельная таблица history_clients_ГГГГММДД
+на каждый день. Записи только добавляются; устаревшие дни удаляются
+целиком (DROP TABLE), без построчного DELETE.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Table
+
+PARTITION_PREFIX = 'history_clients_'
+PARTITION_DATE = '%Y%m%d'
+
+
+def partition_name(day):
+    return f'{PARTITION_PREFIX}{day:{PARTITION_DATE}}'
+
+
+def partition_day(name):
+    """День таблицы по её имени или None, если это не таблица истории."""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], PARTITION_DATE).date()
+    except ValueError:
+        return None
+
+
+def partition_table(metadata, day):
+    """Описание таблицы истории за день day (datetime.date)."""
+    name = partition_name(day)
+    if name in metadata.tables:
+        return metadata.tables[name]
+    return Table(name, metadata,
+                 Column('id', Integer, primary_key=True),
+                 Column('client', Integer),
+                 Column('ip_address', String),
+                 Column('port', Integer),
+                 Column('event', String),
+                 Column('event_time', DateTime),
+                 Index(f'ix_{name}_client_time', 'client', 'event_time'))
@@ -1,6 +1,5 @@
 from PyQt5.QtWidgets import QMainWindow, QAction, qApp, QLabel, QTableView
-from PyQt5.QtGui import QStandardItemModel, QStandardItem
-from PyQt5.QtCore import QTimer
+from server.admin_models import ActiveClientsModel, ServerEvents
 from server.stat_window import StatWindow
 from server.config_window import ConfigWindow
 from server.add_user import RegisterUser
@@ -52,11 +51,9 @@ class MainWindow(QMainWindow):
         self.active_clients_table.move(10, 45)
         self.active_clients_table.setFixedSize(780, 400)
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.create_users_model)
-        self.timer.start(1000)
+        self.create_users_model()
 
-        self.refresh_button.triggered.connect(self.create_users_model)
+        self.refresh_button.triggered.connect(self.active_clients_model.reload)
         self.show_history_button.triggered.connect(self.show_statistics)
         self.config_btn.triggered.connect(self.server_config)
         self.register_btn.triggered.connect(self.reg_user)
@@ -65,24 +62,18 @@ class MainWindow(QMainWindow):
         self.show()
 
     def create_users_model(self):
-        list_users = self.database.active_clients_list()
-        list = QStandardItemModel()
-        list.setHorizontalHeaderLabels(
-            ['Имя Клиента', 'IP Адрес', 'Порт', 'Время подключения'])
-        for row in list_users:
-            user, ip, port, time = row
-            user = QStandardItem(user)
-            user.setEditable(False)
-            ip = QStandardItem(ip)
-            ip.setEditable(False)
-            port = QStandardItem(str(port))
-            port.setEditable(False)
-            time = QStandardItem(str(time.replace(microsecond=0)))
-            time.setEditable(False)
-            list.appendRow([user, ip, port, time])
-        self.active_clients_table.setModel(list)
+        """
+        Таблица пользователей в сети: загружается страницами по мере
+        прокрутки и обновляется по событиям входа и выхода от сервера,
+        а не перестраивается по таймеру.
+        """
+        self.active_clients_model = ActiveClientsModel(self.database)
+        self.server_events = ServerEvents()
+        self.server_events.connected.connect(self.active_clients_model.client_connected)
+        self.server_events.disconnected.connect(self.active_clients_model.client_disconnected)
+        self.server_thread.subscribe(self.server_events)
+        self.active_clients_table.setModel(self.active_clients_model)
         self.active_clients_table.resizeColumnsToContents()
-        self.active_clients_table.resizeRowsToContents()
 
     def show_statistics(self):
         global stat_window
@@ -0,0 +1,109 @@
+"""
+Обновление схемы базы сервера.
+
+Версия схемы хранится в таблице schema_version. Каждая миграция -
+функция upgrade(connection, tables), выполняется один раз в порядке
+номеров, в одной транзакции с записью новой версии. Миграции должны
+быть повторяемыми: базу, созданную create_all по текущим моделям, они
+не меняют.
+"""
+import logging
+from itertools import groupby
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, func, inspect, select
+
+from server.history_partitions import partition_table
+
+logger = logging.getLogger('server')
+
+schema_metadata = MetaData()
+schema_version = Table('schema_version', schema_metadata,
+                       Column('version', Integer, nullable=False))
+
+# Таблицы, которых больше нет в моделях, но с которыми работают уже
+# выпущенные миграции. Опубликованные миграции не меняются: если
+# таблицу убрала более поздняя миграция, ранние видят её здесь.
+legacy_metadata = MetaData()
+Table('history_clients', legacy_metadata,
+      Column('id', Integer, primary_key=True),
+      Column('client', Integer),
+      Column('ip_address', String),
+      Column('port', Integer),
+      Column('event', String),
+      Column('event_time', DateTime),
+      Index('ix_history_clients_client_time', 'client', 'event_time'))
+
+
+def create_indexes(*names):
+    """Миграция, создающая индексы таблиц по именам, если их ещё нет."""
+
+    def upgrade(connection, tables):
+        existing = set(inspect(connection).get_table_names())
+        for table in tables.values():
+            if table.name not in existing:
+                continue
+            for index in table.indexes:
+                if index.name in names:
+                    index.create(connection, checkfirst=True)
+
+    return upgrade
+
+
+def unique_contacts(connection, tables):
+    """Удалить повторы пар (client, contact) и запретить их уникальным индексом."""
+    contacts = tables['contacts']
+    keep = select(func.min(contacts.c.id)).group_by(contacts.c.client, contacts.c.contact)
+    connection.execute(contacts.delete().where(contacts.c.id.not_in(keep.scalar_subquery())))
+    create_indexes('ux_contacts_client_contact')(connection, tables)
+
+
+def partition_history(connection, tables):
+    """
+    Разложить прежнюю таблицу history_clients по таблицам дней и удалить
+    её вместе с индексом ix_history_clients_client_time из миграции 1.
+    """
+    if not inspect(connection).has_table('history_clients'):
+        return
+    legacy = Table('history_clients', MetaData(), autoload_with=connection)
+    partitions = MetaData()
+    result = connection.execute(
+        select(legacy.c.client, legacy.c.ip_address, legacy.c.port, legacy.c.event, legacy.c.event_time).
+        where(legacy.c.event_time.is_not(None)).order_by(legacy.c.event_time, legacy.c.id))
+    for rows in result.mappings().partitions(10000):
+        for day, day_rows in groupby(rows, key=lambda row: row['event_time'].date()):
+            table = partition_table(partitions, day)
+            table.create(connection, checkfirst=True)
+            connection.execute(table.insert(), [dict(row) for row in day_rows])
+    legacy.drop(connection)
+
+
+MIGRATIONS = (
+    (1, 'индексы внешних ключей', create_indexes('ix_contacts_contact',
+                                                 'ix_history_clients_client_time',
+                                                 'ix_history_action_client',
+                                                 'ix_offline_messages_client')),
+    (2, 'уникальная пара (client, contact)', unique_contacts),
+    (3, 'история подключений по дням', partition_history),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection):
+    return connection.execute(select(schema_version.c.version)).scalar()
+
+
+def migrate(engine, metadata):
+    """Довести схему базы до SCHEMA_VERSION. Возвращает прежнюю версию."""
+    schema_metadata.create_all(engine)
+    tables = {**legacy_metadata.tables, **metadata.tables}
+    with engine.begin() as connection:
+        version = get_version(connection)
+        if version is None:
+            connection.execute(schema_version.insert().values(version=0))
+            version = 0
+        for number, description, upgrade in MIGRATIONS:
+            if number > version:
+                logger.info(f'Миграция базы до версии {number}: {description}')
+                upgrade(connection, tables)
+                connection.execute(schema_version.update().values(version=number))
+    return version
@@ -0,0 +1,99 @@
+"""Буфер исходящих данных клиента с ограничением объёма."""
+import logging
+import tempfile
+
+logger = logging.getLogger('server')
+
+POLICY_DROP = 'drop'
+POLICY_DISCONNECT = 'disconnect'
+POLICY_SPILL = 'spill'
+POLICIES = (POLICY_DROP, POLICY_DISCONNECT, POLICY_SPILL)
+
+
+class OutboundQueue:
+    """
+    Очередь байт, ожидающих отправки одному клиенту.
+
+    Пока объём в памяти не превышает high_watermark, данные просто
+    накапливаются. При превышении применяется policy:
+
+    * drop - новые сообщения отбрасываются, пока буфер не опустится
+      ниже low_watermark;
+    * disconnect - push возвращает False, соединение нужно закрыть;
+    * spill - данные дописываются во временный файл и подгружаются
+      обратно в память, когда буфер опускается ниже low_watermark.
+    """
+
+    def __init__(self, high_watermark, low_watermark, policy):
+        if policy not in POLICIES:
+            raise ValueError(f'Неизвестная политика переполнения: {policy}')
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.policy = policy
+        self.buffer = bytearray()
+        self.overflowed = False
+        self.dropped = 0
+        self.spill = None
+        self.spill_read = 0
+        self.spill_write = 0
+
+    def __len__(self):
+        return len(self.buffer) + self.spill_write - self.spill_read
+
+    def push(self, data, required=False):
+        """
+        Добавить данные. False - клиент не успевает и должен быть отключён.
+        required - данные, которые нельзя отбросить или отклонить (отложенные
+        сообщения при входе): при переполнении они принимаются сверх
+        high_watermark, а при политике spill - во временный файл.
+        """
+        if self.spill is not None:
+            self.write_spill(data)
+            return True
+        if self.overflowed or self.buffer and len(self.buffer) + len(data) > self.high_watermark:
+            if required and self.policy != POLICY_SPILL:
+                self.buffer += data
+                return True
+            if self.policy == POLICY_DISCONNECT:
+                return False
+            if self.policy == POLICY_DROP:
+                if not self.overflowed:
+                    logger.warning('Буфер клиента переполнен, сообщения отбрасываются')
+                self.overflowed = True
+                self.dropped += 1
+                return True
+            self.write_spill(data)
+            return True
+        self.buffer += data
+        return True
+
+    def consume(self, count):
+        """Убрать из начала буфера отправленные байты."""
+        del self.buffer[:count]
+        if len(self.buffer) <= self.low_watermark:
+            self.overflowed = False
+            if self.spill is not None:
+                self.read_spill()
+
+    def write_spill(self, data):
+        if self.spill is None:
+            logger.warning('Буфер клиента переполнен, сообщения сбрасываются на диск')
+            self.spill = tempfile.TemporaryFile(buffering=0)
+        self.spill.seek(self.spill_write)
+        self.spill.write(data)
+        self.spill_write += len(data)
+
+    def read_spill(self):
+        self.spill.seek(self.spill_read)
+        data = self.spill.read(self.high_watermark - len(self.buffer))
+        self.spill_read += len(data)
+        self.buffer += data
+        if self.spill_read >= self.spill_write:
+            self.close()
+
+    def close(self):
+        """Удалить временный файл, если он был создан."""
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+            self.spill_read = self.spill_write = 0
@@ -41,12 +41,8 @@ class DelUserDialog(QDialog):
         self.selector.addItems(self.database.clients_list())
 
     def remove_user(self):
-        self.database.remove_user(self.selector.currentText())
+        self.server.call_soon(self.server.remove_user, self.selector.currentText())
         self.messages.information(self, 'Успех', f'Пользователь {self.selector.currentText()} удалён.')
-        if self.selector.currentText() in self.server.user_names:
-            sock = self.server.user_names[self.selector.currentText()]
-            del self.server.user_names[self.selector.currentText()]
-            self.server.remove_client(sock)
         self.close()
 
 
@@ -1,6 +1,6 @@
-from PyQt5.QtWidgets import QDialog, QPushButton, QTableView
-from PyQt5.QtGui import QStandardItemModel, QStandardItem
+from PyQt5.QtWidgets import QDialog, QPushButton, QTableView, QLabel
 from PyQt5.QtCore import Qt
+from server.admin_models import StatModel
 
 
 class StatWindow(QDialog):
@@ -24,25 +24,21 @@ class StatWindow(QDialog):
         self.stat_table.move(10, 10)
         self.stat_table.setFixedSize(580, 620)
 
+        self.lag_label = QLabel(self)
+        self.lag_label.setFixedSize(230, 30)
+        self.lag_label.move(10, 650)
+
         self.create_stat_model()
+        self.show_flush_lag()
 
     def create_stat_model(self):
-        stat_list = self.database.message_history()
-
-        list = QStandardItemModel()
-        list.setHorizontalHeaderLabels(
-            ['Имя Клиента', 'Последний раз входил', 'Сообщений отправлено', 'Сообщений получено'])
-        for row in stat_list:
-            user, last_seen, sent, recvd = row
-            user = QStandardItem(user)
-            user.setEditable(False)
-            last_seen = QStandardItem(str(last_seen.replace(microsecond=0)))
-            last_seen.setEditable(False)
-            sent = QStandardItem(str(sent))
-            sent.setEditable(False)
-            recvd = QStandardItem(str(recvd))
-            recvd.setEditable(False)
-            list.appendRow([user, last_seen, sent, recvd])
-        self.stat_table.setModel(list)
+        """Статистика загружается страницами по мере прокрутки таблицы."""
+        self.stat_model = StatModel(self.database)
+        self.stat_table.setModel(self.stat_model)
         self.stat_table.resizeColumnsToContents()
-        self.stat_table.resizeRowsToContents()
+
+    def show_flush_lag(self):
+        """Насколько записанная в базу статистика отстаёт от счётчиков сервера."""
+        lag, last_lag = self.database.flush_lag()
+        self.lag_label.setText(f'Ожидает записи: {lag:.1f} с\n'
+                               f'При последней записи: {last_lag:.1f} с')
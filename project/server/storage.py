@@ -0,0 +1,139 @@
+"""Интерфейс хранилища сервера и выбор реализации по настройкам."""
+import os
+from abc import ABC, abstractmethod
+
+
+class ServerStorage(ABC):
+    """
+    Всё, что сервер и его окна запрашивают у хранилища. Реализации -
+    ServerDB (файл SQLite) и PooledServerDB (СУБД по DSN с пулом
+    соединений) в server_database.
+    """
+
+    # Пользователи
+    @abstractmethod
+    def get_user(self, name):
+        """UserRecord (id, хэш пароля, публичный ключ) или None."""
+
+    @abstractmethod
+    def check_user(self, name):
+        """Зарегистрирован ли пользователь."""
+
+    @abstractmethod
+    def get_hash(self, name):
+        """Хэш пароля пользователя."""
+
+    @abstractmethod
+    def get_pubkey(self, name):
+        """Публичный ключ пользователя."""
+
+    @abstractmethod
+    def add_user(self, name, passwd_hash):
+        """Зарегистрировать пользователя."""
+
+    @abstractmethod
+    def remove_user(self, name):
+        """Удалить пользователя вместе с его данными."""
+
+    @abstractmethod
+    def clients_list(self):
+        """Имена всех зарегистрированных пользователей."""
+
+    @abstractmethod
+    def users_version(self):
+        """Текущая версия списка пользователей."""
+
+    @abstractmethod
+    def users_changes(self, version):
+        """(добавленные, удалённые, текущая версия) после версии version."""
+
+    # Подключения
+    @abstractmethod
+    def client_login(self, username, ip_address, port, key):
+        """Отметить вход. True - пользователь сменил публичный ключ."""
+
+    @abstractmethod
+    def client_logout(self, username):
+        """Отметить выход."""
+
+    @abstractmethod
+    def active_clients_list(self, after=None, limit=None):
+        """(имя, адрес, порт, время входа) пользователей в сети, по имени после after."""
+
+    @abstractmethod
+    def history_clients_list(self, username=None, since=None, until=None):
+        """(имя, событие, время, адрес, порт) истории подключений за период."""
+
+    # Контакты
+    @abstractmethod
+    def add_contact(self, client_name, contact_name):
+        """Добавить контакт в список пользователя."""
+
+    @abstractmethod
+    def delete_contact(self, client_name, contact_name):
+        """Удалить контакт из списка пользователя."""
+
+    @abstractmethod
+    def contacts_list(self, name):
+        """Имена контактов пользователя."""
+
+    # Сообщения
+    @abstractmethod
+    def store_offline_message(self, name, message):
+        """Сохранить сообщение для пользователя не в сети."""
+
+    @abstractmethod
+    def peek_offline_messages(self, name):
+        """(номер, сообщение) ожидающих пользователя сообщений, не удаляя их."""
+
+    @abstractmethod
+    def ack_offline_messages(self, name, last_id):
+        """Удалить доставленные сообщения пользователя с номерами до last_id."""
+
+    @abstractmethod
+    def modification_action_history(self, sender, receiver):
+        """Учесть сообщение в статистике."""
+
+    @abstractmethod
+    def flush_deadline(self):
+        """Момент (time.monotonic), к которому нужно записать статистику, или None."""
+
+    @abstractmethod
+    def flush_action_history_if_due(self):
+        """Записать статистику, если подошёл срок."""
+
+    @abstractmethod
+    def flush_action_history(self):
+        """Записать накопленную статистику."""
+
+    @abstractmethod
+    def flush_lag(self):
+        """(сколько секунд ждёт записи статистика, отставание при последней записи)."""
+
+    @abstractmethod
+    def message_history(self, after=None, limit=None):
+        """(имя, последний вход, отправлено, получено), по имени после after."""
+
+    @abstractmethod
+    def close(self):
+        """Записать несохранённое и освободить ресурсы."""
+
+
+def create_storage(settings):
+    """
+    Создать хранилище по секции SETTINGS файла server.ini. Если задан
+    database_dsn, используется СУБД по этому DSN (спул отложенных
+    сообщений остаётся в database_path), иначе - файл SQLite
+    database_path/database_file.
+    """
+    from server.server_database import ServerDB, PooledServerDB, HISTORY_RETENTION_DAYS
+
+    retention = settings.getint('history_retention_days', HISTORY_RETENTION_DAYS)
+    dsn = settings.get('database_dsn', '').strip()
+    if dsn:
+        spool_path = os.path.join(settings['database_path'], 'offline_messages.spool')
+        return PooledServerDB(dsn, spool_path, history_retention_days=retention,
+                              pool_size=settings.getint('database_pool_size', 5),
+                              max_overflow=settings.getint('database_max_overflow', 10))
+    return ServerDB(os.path.join(settings['database_path'], settings['database_file']),
+                    history_retention_days=retention)
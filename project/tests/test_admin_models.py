@@ -0,0 +1,89 @@
+import os
+import selectors
+import socket
+import tempfile
+import unittest
+from datetime import datetime
+from project.server.server_database import ServerDB
+from project.server.admin_models import ActiveClientsModel, StatModel, PagedTableModel
+from project.server.core import Server, ClientConnection, AUTHENTICATED
+
+
+class TestClassAdminModels(unittest.TestCase):
+    """Тестирование постраничных моделей окон администратора"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = ServerDB(os.path.join(self.directory.name, 'server.db3'))
+        for number in range(5):
+            name = f'user{number * 2}'
+            self.database.add_user(name, 'hash')
+            self.database.client_login(name, '127.0.0.1', 7000 + number, 'key')
+        self.model = ActiveClientsModel(self.database, page_size=2)
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def names(self):
+        return [self.model.index(row, 0).data() for row in range(self.model.rowCount())]
+
+    def test_pages(self):
+        """Строки загружаются страницами до конца таблицы"""
+        self.assertTrue(self.model.canFetchMore())
+        self.model.fetchMore()
+        self.assertEqual(self.names(), ['user0', 'user2'])
+        self.model.fetchMore()
+        self.model.fetchMore()
+        self.assertEqual(self.names(), ['user0', 'user2', 'user4', 'user6', 'user8'])
+        self.assertFalse(self.model.canFetchMore())
+
+    def test_events(self):
+        """Вход в пределах загруженного добавляет строку, за пределами - пропускается"""
+        self.model.fetchMore()
+        self.model.client_connected('user1', '127.0.0.1', 7777, datetime.now())
+        self.model.client_connected('user9', '127.0.0.1', 7777, datetime.now())
+        self.assertEqual(self.names(), ['user0', 'user1', 'user2'])
+        self.model.client_connected('user0', '10.0.0.1', 7777, datetime.now())
+        self.assertEqual(self.model.index(0, 1).data(), '10.0.0.1')
+        self.model.client_disconnected('user2')
+        self.model.client_disconnected('user4')
+        self.assertEqual(self.names(), ['user0', 'user1'])
+
+    def test_stat(self):
+        """Статистика загружается страницами"""
+        model = StatModel(self.database, page_size=3)
+        model.fetchMore()
+        self.assertEqual(model.rowCount(), 3)
+        self.assertEqual(model.index(0, 2).data(), '0')
+        model.fetchMore()
+        self.assertEqual(model.rowCount(), 5)
+        self.assertFalse(model.canFetchMore())
+
+    def test_abstract_page(self):
+        """Модель без load_page создать нельзя"""
+        self.assertRaises(TypeError, PagedTableModel, self.database)
+
+    def test_removed_user(self):
+        """Удаление пользователя в сети убирает его строку по событию выхода"""
+        server = Server('127.0.0.1', 7777, self.database)
+        server.subscribe(self.model)
+        server.selector = selectors.DefaultSelector()
+        client, peer = socket.socketpair()
+        conn = server.clients[client] = ClientConnection(client, server.create_outbound())
+        conn.state = AUTHENTICATED
+        conn.account_name = 'user2'
+        server.user_names['user2'] = client
+        server.selector.register(client, selectors.EVENT_READ, server.service_connection)
+        self.model.fetchMore()
+
+        server.remove_user('user2')
+        self.assertEqual(self.names(), ['user0'])
+        self.assertFalse(self.database.check_user('user2'))
+        self.assertEqual(peer.recv(1), b'')
+        peer.close()
+        server.selector.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from project.client.client_database import ClientDB, SCHEMA_VERSION
+from project.client.history_model import HistoryModel
+
+
+class TestClassClientHistory(unittest.TestCase):
+    """Тестирование постраничной выборки истории сообщений"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = ClientDB(os.path.join(self.directory.name, 'test'))
+        start = datetime(2026, 1, 1)
+        for number in range(10):
+            row = self.database.HistoryMessages('friend', 'in', f'сообщение {number}')
+            row.message_time = start + timedelta(seconds=number)
+            self.database.session.add(row)
+        self.database.session.commit()
+
+    def tearDown(self):
+        self.database.session.close()
+        self.database.engine.dispose()
+        self.directory.cleanup()
+
+    def test_full_history(self):
+        """Без ограничения история возвращается целиком от старых к новым"""
+        history = self.database.get_history('friend')
+        self.assertEqual([row[2] for row in history], [f'сообщение {number}' for number in range(10)])
+
+    def test_last_page(self):
+        """С ограничением возвращаются последние сообщения"""
+        history = self.database.get_history('friend', limit=3)
+        self.assertEqual([row[2] for row in history], ['сообщение 7', 'сообщение 8', 'сообщение 9'])
+
+    def test_older_page(self):
+        """Страница сообщений старше первой строки загруженной страницы"""
+        last_page = self.database.get_history('friend', limit=3)
+        history = self.database.get_history('friend', before=last_page[0][3:], limit=3)
+        self.assertEqual([row[2] for row in history], ['сообщение 4', 'сообщение 5', 'сообщение 6'])
+
+    def test_equal_time_pages(self):
+        """Сообщения с одинаковым временем не теряются на границе страниц"""
+        same_time = datetime(2026, 1, 2)
+        for number in range(6):
+            row = self.database.HistoryMessages('burst', 'in', f'm{number}')
+            row.message_time = same_time
+            self.database.session.add(row)
+        self.database.session.commit()
+        model = HistoryModel(self.database, page_size=3)
+        model.set_contact('burst')
+        self.assertEqual(model.load_older(), 3)
+        self.assertEqual(model.load_older(), 0)
+        self.assertEqual([row[2] for row in model.rows], [f'm{number}' for number in range(6)])
+
+    def test_save_message_row(self):
+        """save_message возвращает строку в формате get_history"""
+        row = self.database.save_message('friend', 'out', 'ответ')
+        self.assertEqual(self.database.get_history('friend', limit=1), [row])
+
+
+class TestClassClientSearch(unittest.TestCase):
+    """Тестирование полнотекстового поиска по истории"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = ClientDB(os.path.join(self.directory.name, 'test'))
+        self.database.save_message('friend', 'in', 'встречаемся завтра у метро')
+        self.database.save_message('friend', 'out', 'договорились, до завтра')
+        self.database.save_message('other', 'in', 'завтрак готов')
+
+    def tearDown(self):
+        self.database.session.close()
+        self.database.engine.dispose()
+        self.directory.cleanup()
+
+    def test_search(self):
+        """Найдены сообщения со словом, найденное слово выделено"""
+        hits = self.database.search_history('метро')
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0][2], 'встречаемся завтра у метро')
+        self.assertIn('[метро]', hits[0][5])
+
+    def test_search_prefix_and_contact(self):
+        """Последнее слово ищется как начало слова, поиск ограничивается контактом"""
+        self.assertEqual(len(self.database.search_history('завтр')), 3)
+        self.assertEqual(len(self.database.search_history('завтр', contact='friend')), 2)
+
+    def test_search_syntax(self):
+        """Кавычки и операторы в запросе не ломают поиск"""
+        self.assertEqual(self.database.search_history('"метро AND'), [])
+        self.assertEqual(self.database.search_history('  '), [])
+
+    def test_search_equal_time(self):
+        """Совпадения с одинаковым временем различаются по id и открывают историю с нужного места"""
+        same_time = datetime(2026, 1, 2)
+        for number in range(3):
+            row = self.database.HistoryMessages('burst', 'in', 'повтор')
+            row.message_time = same_time
+            self.database.session.add(row)
+        self.database.session.commit()
+        hits = self.database.search_history('повтор')
+        ids = [hit[4] for hit in hits]
+        self.assertEqual(ids, sorted(set(ids), reverse=True))
+        older = self.database.get_history('burst', before=hits[0][3:5])
+        self.assertEqual([row[4] for row in older], ids[:0:-1])
+
+    def test_search_after_delete(self):
+        """Удалённые сообщения пропадают из индекса"""
+        self.database.session.query(self.database.HistoryMessages).filter_by(contact='other').delete()
+        self.database.session.commit()
+        self.assertEqual(len(self.database.search_history('завтр')), 2)
+
+
+class TestClassClientUsers(unittest.TestCase):
+    """Тестирование синхронизации списка известных пользователей"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = ClientDB(os.path.join(self.directory.name, 'test'))
+
+    def tearDown(self):
+        self.database.session.close()
+        self.database.engine.dispose()
+        self.directory.cleanup()
+
+    def test_full_list(self):
+        """Полный список заменяет известных пользователей"""
+        self.database.add_users(['anna', 'boris'], 2)
+        self.database.add_users(['boris', 'vera'], 3)
+        self.assertEqual(sorted(self.database.get_users()), ['boris', 'vera'])
+        self.assertEqual(self.database.get_users_version(), 3)
+
+    def test_update(self):
+        """Изменения применяются к списку, повторное добавление не ошибка"""
+        self.assertIsNone(self.database.get_users_version())
+        self.database.add_users(['anna', 'boris'], 2)
+        self.database.update_users(['boris', 'vera'], ['anna'], 4)
+        self.assertEqual(sorted(self.database.get_users()), ['boris', 'vera'])
+        self.assertEqual(self.database.get_users_version(), 4)
+
+
+class TestClassClientMigration(unittest.TestCase):
+    """Тестирование обновления схемы существующей базы"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'old')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_index_added(self):
+        """В базу старой версии добавляется индекс истории"""
+        connection = sqlite3.connect(self.path + '.db3')
+        connection.execute('CREATE TABLE history_messages (id INTEGER PRIMARY KEY, contact VARCHAR, '
+                           'status VARCHAR, message VARCHAR, message_time DATETIME)')
+        connection.close()
+        database = ClientDB(self.path)
+        database.session.close()
+        database.engine.dispose()
+        connection = sqlite3.connect(self.path + '.db3')
+        indexes = [row[1] for row in connection.execute('PRAGMA index_list(history_messages)')]
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        connection.close()
+        self.assertIn('ix_history_contact_time', indexes)
+        self.assertEqual(version, SCHEMA_VERSION)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import logging
+import unittest
+from project.logs.decos import log, set_tracing, TRACE_LOGGER
+
+
+@log
+def traced(value):
+    return value
+
+
+def caller():
+    return traced(1)
+
+
+class TestClassLog(unittest.TestCase):
+    """Тестирование декоратора log"""
+
+    def tearDown(self):
+        TRACE_LOGGER.getChild(__name__).setLevel(logging.NOTSET)
+
+    def test_call_logged_with_caller(self):
+        """Вызов записывается с именем вызывающей функции"""
+        set_tracing(True, __name__)
+        with self.assertLogs(TRACE_LOGGER, logging.DEBUG) as logs:
+            self.assertEqual(caller(), 1)
+        self.assertIn(f'{__name__}.caller', logs.output[0])
+
+    def test_tracing_disabled(self):
+        """Выключенная трассировка модуля не создаёт записей"""
+        set_tracing(False, __name__)
+        with self.assertRaises(AssertionError):
+            with self.assertLogs(TRACE_LOGGER, logging.DEBUG):
+                caller()
+
+    def test_wraps(self):
+        """Декоратор сохраняет имя функции"""
+        self.assertEqual(traced.__name__, 'traced')
+
+
+if __name__ == '__main__':
+    unittest.main()
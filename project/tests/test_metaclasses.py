@@ -0,0 +1,56 @@
+import socket
+import unittest
+from project.metaclasses import ServerValidator
+
+
+class CheckedServer(metaclass=ServerValidator):
+    """Минимальный сервер, проходящий проверку"""
+
+    def create_socket(self):
+        return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+
+class TestClassServerValidator(unittest.TestCase):
+    """Тестирование проверки серверного класса metaclasses.ServerValidator"""
+
+    def test_docstring_not_scanned(self):
+        """Строка документации, похожая на код, не проверяется"""
+
+        class DocumentedServer(CheckedServer):
+            """connect()"""
+
+        self.assertTrue(issubclass(DocumentedServer, CheckedServer))
+
+    def test_subclass_inherits_socket(self):
+        """Подкласс использует инициализацию сокета базового сервера"""
+
+        class SubServer(CheckedServer):
+            def run(self):
+                return self.create_socket()
+
+        self.assertTrue(issubclass(SubServer, CheckedServer))
+
+    def test_subclass_connect(self):
+        """Вызов connect в подклассе, в том числе в staticmethod, запрещён"""
+        with self.assertRaises(TypeError):
+            class ConnectingServer(CheckedServer):
+                @staticmethod
+                def reconnect(address):
+                    return connect(address)
+
+    def test_no_socket(self):
+        """Сервер без инициализации сокета отклоняется"""
+        with self.assertRaises(TypeError):
+            class NoSocketServer(metaclass=ServerValidator):
+                def run(self):
+                    pass
+
+    def test_socket_in_docstring(self):
+        """Инициализация сокета в строке документации не засчитывается"""
+        with self.assertRaises(TypeError):
+            class DocstringServer(metaclass=ServerValidator):
+                """socket.socket(socket.AF_INET, socket.SOCK_STREAM)"""
+
+
+if __name__ == '__main__':
+    unittest.main()
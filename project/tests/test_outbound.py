@@ -0,0 +1,61 @@
+import sys
+import os
+import unittest
+
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from project.server.outbound import OutboundQueue
+
+
+class TestClassOutboundQueue(unittest.TestCase):
+    """Тестирование буфера исходящих данных server/outbound.py"""
+
+    def test_disconnect_policy(self):
+        """При переполнении политика disconnect требует закрыть соединение"""
+        queue = OutboundQueue(10, 4, 'disconnect')
+        self.assertTrue(queue.push(b'12345678'))
+        self.assertFalse(queue.push(b'123'))
+
+    def test_drop_policy(self):
+        """Сообщения отбрасываются, пока буфер не опустится ниже low_watermark"""
+        queue = OutboundQueue(10, 4, 'drop')
+        queue.push(b'12345678')
+        queue.push(b'abc')
+        queue.consume(2)
+        queue.push(b'abc')
+        self.assertEqual(queue.dropped, 2)
+        queue.consume(4)
+        queue.push(b'xy')
+        self.assertEqual(bytes(queue.buffer), b'78xy')
+
+    def test_spill_policy(self):
+        """Данные сбрасываются на диск и возвращаются в исходном порядке"""
+        queue = OutboundQueue(10, 4, 'spill')
+        for chunk in (b'12345678', b'abc', b'defgh', b'ij'):
+            queue.push(chunk)
+        self.assertEqual(len(queue), 18)
+        received = b''
+        while queue:
+            received += bytes(queue.buffer)
+            queue.consume(len(queue.buffer))
+        self.assertEqual(received, b'12345678abcdefghij')
+        self.assertIsNone(queue.spill)
+
+    def test_large_message_in_empty_queue(self):
+        """Сообщение больше high_watermark принимается в пустой буфер"""
+        queue = OutboundQueue(10, 4, 'disconnect')
+        self.assertTrue(queue.push(b'x' * 20))
+
+
+    def test_required_data(self):
+        """Обязательные данные не отбрасываются и не закрывают соединение при переполнении"""
+        for policy in ('drop', 'disconnect'):
+            with self.subTest(policy=policy):
+                queue = OutboundQueue(10, 4, policy)
+                queue.push(b'12345678')
+                self.assertTrue(queue.push(b'abcdef', required=True))
+                self.assertEqual(bytes(queue.buffer), b'12345678abcdef')
+                self.assertEqual(queue.dropped, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import io
+import logging
+import queue
+import threading
+import time
+import unittest
+from project.logs.queue_log import BoundedQueueHandler, BatchingQueueListener
+
+
+class BufferedHandler(logging.StreamHandler):
+    """Обработчик, считающий сбросы буфера"""
+
+    def __init__(self):
+        super().__init__(io.StringIO())
+        self.flushes = 0
+
+    def emit(self, record):
+        self.stream.write(self.format(record) + self.terminator)
+
+    def flush(self):
+        self.flushes += 1
+
+
+class FailingHandler(BufferedHandler):
+    """Обработчик, у которого сброс буфера завершается ошибкой"""
+
+    def __init__(self):
+        super().__init__()
+        self.errors = 0
+
+    def flush(self):
+        super().flush()
+        raise ValueError('I/O operation on closed file.')
+
+    def handleError(self, record):
+        self.errors += 1
+
+
+class TestClassQueueLog(unittest.TestCase):
+    """Тестирование записи журнала через очередь"""
+
+    def setUp(self):
+        self.handler = BoundedQueueHandler(queue.Queue(3))
+        self.target = BufferedHandler()
+        self.listener = BatchingQueueListener(self.handler, self.target)
+        self.logger = logging.getLogger('test_queue_log')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        self.listener.stop()
+        self.logger.removeHandler(self.handler)
+
+    def test_full_queue_drops(self):
+        """При переполнении очереди записи отбрасываются и считаются"""
+        for number in range(5):
+            self.logger.debug('запись %d', number)
+        self.assertEqual(self.handler.dropped, 2)
+        self.listener.start()
+        self.listener.stop()
+        output = self.target.stream.getvalue()
+        self.assertIn('запись 2', output)
+        self.assertNotIn('запись 3', output)
+        self.assertIn('потеряно записей: 2', output)
+
+    def test_flush_after_batch(self):
+        """Буфер сбрасывается после пачки записей, а не после каждой"""
+        for number in range(3):
+            self.logger.debug('запись %d', number)
+        self.listener.start()
+        self.listener.stop()
+        self.assertEqual(self.target.stream.getvalue().count('запись'), 3)
+        self.assertLessEqual(self.target.flushes, 2)
+
+
+    def test_failing_flush(self):
+        """Ошибка сброса буфера не останавливает поток записи"""
+        target = FailingHandler()
+        self.listener.handlers = (target,)
+        self.listener.start()
+        self.logger.debug('запись 0')
+        while target.flushes < 2:
+            time.sleep(0.01)
+        self.assertTrue(self.listener._thread.is_alive())
+        self.logger.debug('запись 1')
+        self.listener.stop()
+        self.assertEqual(target.stream.getvalue().count('запись'), 2)
+        self.assertGreater(target.errors, 0)
+
+    def test_stop_after_thread_died(self):
+        """Остановка не ждёт места в полной очереди, если поток уже завершился"""
+        self.listener._thread = threading.Thread(target=lambda: None)
+        self.listener._thread.start()
+        self.listener._thread.join()
+        for number in range(3):
+            self.logger.debug('запись %d', number)
+        self.listener.stop()
+        self.assertIsNone(self.listener._thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import binascii
+import hmac
+from Cryptodome.PublicKey import RSA
+from project.constants import *
+from project.utils import get_message, send_message
+from project.server.server_database import ServerDB
+from project.server.core import Server, AsyncServer
+
+PASSWORD_HASH = b'0123456789abcdef'
+PUBLIC_KEY_PEM = RSA.generate(1024).publickey().export_key().decode('ascii')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServerCoreTests:
+    """Общие тесты Server и AsyncServer на реальных сокетах"""
+    SERVER_CLASS = None
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = ServerDB(os.path.join(self.directory.name, 'server.db3'))
+        for name in ('user1', 'user2'):
+            self.database.add_user(name, PASSWORD_HASH)
+        self.server = self.SERVER_CLASS('127.0.0.1', free_port(), self.database, handshake_timeout=0.5)
+        self.server.daemon = True
+        self.server.start()
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        self.server.shutdown()
+        self.database.close()
+        self.directory.cleanup()
+
+    def call_in_server(self, callback, *args):
+        """Выполнить callback в потоке сервера и дождаться результата."""
+        done = threading.Event()
+        result = []
+        self.server.call_soon(lambda: (result.append(callback(*args)), done.set()))
+        self.assertTrue(done.wait(5))
+        return result[0]
+
+    def connect(self):
+        for _ in range(50):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            try:
+                sock.connect(('127.0.0.1', self.server.port))
+            except ConnectionRefusedError:
+                sock.close()
+                time.sleep(0.05)
+            else:
+                self.sockets.append(sock)
+                return sock
+        self.fail('Сервер не принимает подключения')
+
+    def presence(self, sock, name, key=PUBLIC_KEY_PEM):
+        send_message(sock, {ACTION: PRESENCE, TIME: time.time(),
+                            USER: {ACCOUNT_NAME: name, PUBLIC_KEY: key}})
+        return get_message(sock)
+
+    def login(self, name):
+        sock = self.connect()
+        answer = self.presence(sock, name)
+        self.assertEqual(answer[RESPONSE], 511)
+        digest = hmac.new(PASSWORD_HASH, answer[ALERT].encode('utf-8'), 'MD5').digest()
+        send_message(sock, {RESPONSE: 511, ALERT: binascii.b2a_base64(digest).decode('ascii')})
+        self.assertEqual(get_message(sock)[RESPONSE], 200)
+        return sock
+
+    def assertClosed(self, sock):
+        self.assertEqual(sock.recv(RECV_BUFFER_SIZE), b'')
+
+    def test_presence_timeout(self):
+        """Подключение без PRESENCE закрывается по таймауту"""
+        sock = self.connect()
+        self.assertClosed(sock)
+        self.assertEqual(self.call_in_server(len, self.server.clients), 0)
+
+    def test_digest_timeout(self):
+        """Клиент, не ответивший на 511, отключается по таймауту"""
+        sock = self.connect()
+        self.assertEqual(self.presence(sock, 'user1')[RESPONSE], 511)
+        self.assertClosed(sock)
+
+    def test_authenticated_kept(self):
+        """Таймаут авторизации не касается вошедших пользователей"""
+        sock = self.login('user1')
+        time.sleep(1.5)
+        send_message(sock, {ACTION: GET_CONTACTS, TIME: time.time(), USER: 'user1'})
+        self.assertEqual(get_message(sock), {RESPONSE: 202, ALERT: []})
+
+    def test_request_before_login(self):
+        """До авторизации запросы отклоняются, соединение остаётся"""
+        sock = self.connect()
+        send_message(sock, {ACTION: GET_CONTACTS, TIME: time.time(), USER: 'user1'})
+        self.assertEqual(get_message(sock), {RESPONSE: 400, ERROR: 'Требуется авторизация'})
+        self.assertEqual(self.presence(sock, 'user1')[RESPONSE], 511)
+
+    def test_login(self):
+        """После ответа на 511 пользователь в сети и отмечен в базе"""
+        self.login('user1')
+        self.assertIn('user1', self.call_in_server(dict, self.server.user_names))
+        self.assertEqual([row[0] for row in self.database.active_clients_list()], ['user1'])
+
+    def test_unknown_user(self):
+        """Ответ с ошибкой доходит до клиента перед отключением"""
+        sock = self.connect()
+        answer = self.presence(sock, 'nobody')
+        self.assertEqual(answer[RESPONSE], 400)
+        self.assertIn('не зарегистрирован', answer[ERROR])
+        self.assertClosed(sock)
+
+    def test_invalid_key(self):
+        """PRESENCE с неразбираемым публичным ключом отклоняется"""
+        sock = self.connect()
+        self.assertEqual(self.presence(sock, 'user1', key='not a key'),
+                         {RESPONSE: 400, ERROR: 'Некорректный публичный ключ'})
+        self.assertClosed(sock)
+        self.assertEqual(self.database.active_clients_list(), [])
+
+    def test_wrong_password(self):
+        """Неверный ответ на 511 - ошибка и отключение"""
+        sock = self.connect()
+        self.assertEqual(self.presence(sock, 'user1')[RESPONSE], 511)
+        send_message(sock, {RESPONSE: 511, ALERT: binascii.b2a_base64(b'wrong').decode('ascii')})
+        self.assertEqual(get_message(sock), {RESPONSE: 400, ERROR: 'Неверный пароль'})
+        self.assertClosed(sock)
+
+    def test_name_taken(self):
+        """Второй вход под тем же именем отклоняется"""
+        self.login('user1')
+        sock = self.connect()
+        self.assertEqual(self.presence(sock, 'user1')[RESPONSE], 400)
+        self.assertClosed(sock)
+
+    def test_exit(self):
+        """На EXIT сервер отвечает EXIT и закрывает соединение"""
+        sock = self.login('user1')
+        send_message(sock, {ACTION: EXIT, TIME: time.time(), ACCOUNT_NAME: 'user1'})
+        self.assertEqual(get_message(sock), {ACTION: EXIT})
+        self.assertClosed(sock)
+
+    def message(self, sender, receiver, text, request_id=None):
+        message = {ACTION: MESSAGE, TIME: time.time(), FROM: sender, TO: receiver, MESSAGE_TEXT: text}
+        if request_id is not None:
+            message[REQUEST_ID] = request_id
+        return message
+
+    def test_offline_delivery(self):
+        """Сообщения пользователю не в сети доставляются пакетом после входа, по порядку"""
+        sender = self.login('user1')
+        for number in range(3):
+            send_message(sender, self.message('user1', 'user2', f'text {number}'))
+            self.assertEqual(get_message(sender), {RESPONSE: 200})
+        receiver = self.login('user2')
+        self.assertEqual([get_message(receiver)[MESSAGE_TEXT] for _ in range(3)],
+                         ['text 0', 'text 1', 'text 2'])
+        self.assertEqual(self.call_in_server(self.database.peek_offline_messages, 'user2'), [])
+
+    def test_offline_backlog_over_watermark(self):
+        """Отложенные сообщения доставляются целиком, даже если не помещаются в буфер клиента"""
+        self.server.high_watermark, self.server.low_watermark = 256, 128
+        for name, policy in (('user1', 'drop'), ('user2', 'disconnect')):
+            with self.subTest(policy=policy):
+                self.server.overflow_policy = policy
+                for number in range(3):
+                    self.call_in_server(self.database.store_offline_message, name,
+                                        self.message('user0', name, f'{number} ' + 'x' * 200))
+                receiver = self.login(name)
+                self.assertEqual([get_message(receiver)[MESSAGE_TEXT][0] for _ in range(3)], ['0', '1', '2'])
+                self.assertEqual(self.call_in_server(self.database.peek_offline_messages, name), [])
+
+    def test_request_id(self):
+        """REQUEST_ID возвращается в ответах и не пересылается получателю"""
+        sender = self.login('user1')
+        receiver = self.login('user2')
+        send_message(sender, self.message('user1', 'user2', 'text', request_id=7))
+        send_message(sender, self.message('user1', 'nobody', 'text', request_id=8))
+        send_message(sender, {ACTION: GET_CONTACTS, TIME: time.time(), USER: 'user1'})
+        self.assertEqual(get_message(sender), {RESPONSE: 200, REQUEST_ID: 7})
+        answer = get_message(sender)
+        self.assertEqual((answer[RESPONSE], answer[REQUEST_ID]), (400, 8))
+        self.assertEqual(get_message(sender), {RESPONSE: 202, ALERT: []})
+        relayed = get_message(receiver)
+        self.assertEqual(relayed[MESSAGE_TEXT], 'text')
+        self.assertNotIn(REQUEST_ID, relayed)
+
+    def test_call_soon(self):
+        """Команда из другого потока выполняется в потоке обработчиков сервера"""
+        thread = self.call_in_server(threading.current_thread)
+        self.assertIsNot(thread, threading.current_thread())
+        self.assertIn(thread.name, (self.server.name, 'server-handlers_0'))
+
+    def test_remove_user(self):
+        """Удаление пользователя в сети из потока интерфейса"""
+        sock = self.login('user1')
+        self.server.call_soon(self.server.remove_user, 'user1')
+        self.assertFalse(self.call_in_server(self.database.check_user, 'user1'))
+        self.assertNotIn('user1', self.call_in_server(dict, self.server.user_names))
+        self.assertClosed(sock)
+
+
+class TestClassServer(ServerCoreTests, unittest.TestCase):
+    SERVER_CLASS = Server
+
+
+class TestClassAsyncServer(ServerCoreTests, unittest.TestCase):
+    SERVER_CLASS = AsyncServer
+
+    def test_maintenance_thread(self):
+        """Срок плановых задач вычисляется в потоке обработчиков, а не цикла событий"""
+        threads = []
+        next_deadline = self.server.next_deadline
+
+        def recording_next_deadline():
+            threads.append(threading.current_thread().name)
+            return next_deadline()
+
+        self.server.next_deadline = recording_next_deadline
+        while len(threads) < 2:
+            time.sleep(0.05)
+        self.assertTrue(all(name.startswith('server-handlers') for name in threads))
+
+    def test_maintenance_error(self):
+        """Ошибка плановой задачи не останавливает таймауты авторизации"""
+        maintenance = self.server.maintenance
+        errors = []
+
+        def failing_maintenance():
+            if not errors:
+                errors.append(True)
+                raise IndexError('deque index out of range')
+            maintenance()
+
+        self.server.maintenance = failing_maintenance
+        sock = self.connect()
+        self.assertClosed(sock)
+        self.assertEqual(errors, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,328 @@
+import configparser
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, event
+from project.server.server_database import ServerDB, PooledServerDB
+from project.server.storage import create_storage
+from project.server.migrations import SCHEMA_VERSION, MIGRATIONS, legacy_metadata
+from project.server.history_partitions import partition_name
+
+
+class TestClassServerUsers(unittest.TestCase):
+    """Тестирование хранилища сервера в файле SQLite"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = self.open_database()
+
+    def open_database(self):
+        return ServerDB(os.path.join(self.directory.name, 'server.db3'))
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_changes(self):
+        """Возвращаются только изменения после версии клиента"""
+        self.database.add_user('anna', 'hash')
+        self.database.add_user('boris', 'hash')
+        version = self.database.users_version()
+        self.database.add_user('vera', 'hash')
+        self.database.remove_user('anna')
+        added, removed, current = self.database.users_changes(version)
+        self.assertEqual(added, ['vera'])
+        self.assertEqual(removed, ['anna'])
+        self.assertEqual(current, self.database.users_version())
+
+    def test_no_changes(self):
+        """Без изменений версия не меняется"""
+        self.database.add_user('anna', 'hash')
+        version = self.database.users_version()
+        self.assertEqual(self.database.users_changes(version), ([], [], version))
+
+    def test_existing_users_logged(self):
+        """Пользователи базы без журнала попадают в журнал при открытии"""
+        path = os.path.join(self.directory.name, 'old.db3')
+        database = ServerDB(path)
+        database.add_user('anna', 'hash')
+        database.session.query(database.UsersLog).delete()
+        database.session.commit()
+        database.close()
+        database = ServerDB(path)
+        self.assertEqual(database.users_changes(0)[0], ['anna'])
+        database.close()
+
+    def test_session(self):
+        """Вход, контакты, отложенные сообщения и удаление пользователя"""
+        self.database.add_user('anna', 'hash')
+        self.database.add_user('boris', 'hash')
+        self.assertFalse(self.database.client_login('anna', '127.0.0.1', 7777, 'key'))
+        self.assertEqual([row[0] for row in self.database.active_clients_list()], ['anna'])
+        self.database.add_contact('anna', 'boris')
+        self.database.add_contact('boris', 'anna')
+        self.assertEqual(self.database.contacts_list('anna'), ['boris'])
+        self.database.store_offline_message('boris', {'message': 'привет'})
+        messages = self.database.peek_offline_messages('boris')
+        self.assertEqual([message for _, message in messages], [{'message': 'привет'}])
+        self.database.ack_offline_messages('boris', messages[-1][0])
+        self.assertEqual(self.database.peek_offline_messages('boris'), [])
+        self.database.modification_action_history('anna', 'boris')
+        self.database.flush_action_history()
+        self.database.client_logout('anna')
+        self.assertEqual(self.database.active_clients_list(), [])
+        self.database.remove_user('anna')
+        self.assertEqual(self.database.clients_list(), ['boris'])
+        self.assertEqual(self.database.contacts_list('boris'), [])
+        self.assertEqual([row[2:] for row in self.database.message_history()], [(0, 1)])
+
+
+    def test_remove_cached_user(self):
+        """Запись, прочитанная другим потоком во время удаления, не остаётся в кэше"""
+        self.database.add_user('anna', 'hash')
+
+        def read_in_other_thread(session):
+            reader = threading.Thread(target=self.database.get_user, args=('anna',))
+            reader.start()
+            reader.join()
+
+        event.listen(self.database.session, 'before_commit', read_in_other_thread)
+        self.database.remove_user('anna')
+        event.remove(self.database.session, 'before_commit', read_in_other_thread)
+        self.assertIsNone(self.database.get_user('anna'))
+
+    def test_flush_lag(self):
+        """Отставание статистики растёт до записи и обнуляется после неё"""
+        self.database.add_user('anna', 'hash')
+        self.assertEqual(self.database.flush_lag(), (0.0, 0.0))
+        self.database.modification_action_history('anna', 'anna')
+        self.assertGreater(self.database.flush_lag()[0], 0)
+        self.database.flush_action_history()
+        lag, last_lag = self.database.flush_lag()
+        self.assertEqual(lag, 0.0)
+        self.assertGreater(last_lag, 0)
+
+class TestClassPooledServerUsers(TestClassServerUsers):
+    """Тестирование хранилища с пулом соединений; вместо СУБД - SQLite по DSN"""
+
+    def open_database(self):
+        return PooledServerDB(f'sqlite:///{os.path.join(self.directory.name, "pooled.db3")}',
+                              os.path.join(self.directory.name, 'pooled.spool'))
+
+
+class TestClassServerMigration(unittest.TestCase):
+    """Тестирование обновления схемы базы сервера"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'server.db3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def indexes(self, connection):
+        return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+    def test_upgrade(self):
+        """В базу без индексов добавляются индексы, повторы контактов удаляются"""
+        database = ServerDB(self.path)
+        database.add_user('anna', 'hash')
+        database.add_user('boris', 'hash')
+        database.close()
+        connection = sqlite3.connect(self.path)
+        for index in self.indexes(connection):
+            if not index.startswith('sqlite_'):
+                connection.execute(f'DROP INDEX {index}')
+        connection.execute('DROP TABLE schema_version')
+        connection.executemany('INSERT INTO contacts (client, contact) VALUES (?, ?)', [(1, 2), (1, 2)])
+        connection.commit()
+        connection.close()
+
+        database = ServerDB(self.path)
+        self.assertEqual(database.contacts_list('anna'), ['boris'])
+        database.close()
+        connection = sqlite3.connect(self.path)
+        self.assertTrue({'ux_contacts_client_contact', 'ix_contacts_contact',
+                         'ix_history_action_client', 'ix_offline_messages_client'} <= self.indexes(connection))
+        self.assertEqual(connection.execute('SELECT version FROM schema_version').fetchall(), [(SCHEMA_VERSION,)])
+        connection.close()
+
+    def legacy_history(self, version):
+        """База с прежней таблицей history_clients на версии схемы version."""
+        database = ServerDB(self.path)
+        database.add_user('anna', 'hash')
+        database.close()
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE history_clients (id INTEGER PRIMARY KEY, client INTEGER, '
+                           'ip_address VARCHAR, port INTEGER, event VARCHAR, event_time DATETIME)')
+        now = datetime.now()
+        connection.executemany('INSERT INTO history_clients (client, ip_address, port, event, event_time) '
+                               'VALUES (1, ?, 7777, ?, ?)',
+                               [('127.0.0.1', 'connect', str(now - timedelta(days=1))),
+                                ('127.0.0.1', 'disconnect', str(now - timedelta(days=1, seconds=-1))),
+                                ('127.0.0.1', 'connect', str(now - timedelta(seconds=1)))])
+        connection.execute('UPDATE schema_version SET version = ?', (version,))
+        connection.commit()
+        connection.close()
+
+    def test_partition_history(self):
+        """Прежняя таблица истории раскладывается по дням"""
+        for version in (2, 0):
+            with self.subTest(version=version):
+                self.legacy_history(version)
+                database = ServerDB(self.path)
+                self.assertEqual([row[1] for row in database.history_clients_list('anna')],
+                                 ['connect', 'disconnect', 'connect'])
+                database.close()
+                connection = sqlite3.connect(self.path)
+                tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                self.assertNotIn('ix_history_clients_client_time', self.indexes(connection))
+                connection.close()
+                self.assertNotIn('history_clients', tables)
+                self.assertIn(partition_name(datetime.now().date()), tables)
+                os.remove(self.path)
+
+    def test_first_migration(self):
+        """Миграция 1 по-прежнему индексирует прежнюю таблицу истории"""
+        self.legacy_history(0)
+        engine = create_engine(f'sqlite:///{self.path}')
+        with engine.begin() as connection:
+            MIGRATIONS[0][2](connection, {**legacy_metadata.tables, **ServerDB.Base.metadata.tables})
+            self.assertIn('ix_history_clients_client_time',
+                          {row[0] for row in connection.exec_driver_sql(
+                              "SELECT name FROM sqlite_master WHERE type = 'index'")})
+        engine.dispose()
+
+
+class TestClassServerHistory(unittest.TestCase):
+    """Тестирование истории подключений по дням"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = ServerDB(os.path.join(self.directory.name, 'server.db3'), history_retention_days=3)
+        self.database.add_user('anna', 'hash')
+        self.database.add_user('boris', 'hash')
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def test_time_range(self):
+        """Выбираются только события за период и только нужного пользователя"""
+        self.database.client_login('anna', '127.0.0.1', 7777, 'key')
+        self.database.client_login('boris', '127.0.0.1', 7778, 'key')
+        self.database.client_logout('anna')
+        self.assertEqual([row[:2] for row in self.database.history_clients_list('anna')],
+                         [('anna', 'connect'), ('anna', 'disconnect')])
+        self.assertEqual(len(self.database.history_clients_list()), 3)
+        self.assertEqual(self.database.history_clients_list(until=datetime.now() - timedelta(hours=1)), [])
+
+    def test_retention(self):
+        """Таблицы дней старше срока хранения удаляются при смене дня"""
+        today = date.today()
+        for days in (5, 3, 2):
+            self.database.history_partition(today - timedelta(days=days))
+        self.assertEqual(sorted(self.database.history_tables),
+                         [today - timedelta(days=3), today - timedelta(days=2)])
+        self.database.history_partition(today)
+        self.assertEqual(sorted(self.database.history_tables),
+                         [today - timedelta(days=3), today - timedelta(days=2), today])
+        self.database.drop_expired_history(today + timedelta(days=2))
+        self.assertEqual(sorted(self.database.history_tables), [today])
+
+
+class TestClassOfflineSpool(unittest.TestCase):
+    """Тестирование спула отложенных сообщений"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'server.db3')
+        self.database = ServerDB(self.path)
+        self.database.add_user('anna', 'hash')
+        self.database.add_user('boris', 'hash')
+
+    def tearDown(self):
+        self.database.close()
+        self.directory.cleanup()
+
+    def message(self, text):
+        return {'action': 'msg', 'message': text}
+
+    def deliver(self, name):
+        """Забрать и подтвердить все сообщения пользователя."""
+        messages = self.database.peek_offline_messages(name)
+        if messages:
+            self.database.ack_offline_messages(name, messages[-1][0])
+        return [message for _, message in messages]
+
+    def test_ack(self):
+        """Сообщения удаляются только после подтверждения и только переданные"""
+        self.database.store_offline_message('anna', self.message('first'))
+        messages = self.database.peek_offline_messages('anna')
+        self.database.store_offline_message('anna', self.message('second'))
+        self.assertEqual([message for _, message in self.database.peek_offline_messages('anna')],
+                         [self.message('first'), self.message('second')])
+        self.database.ack_offline_messages('anna', messages[-1][0])
+        self.assertEqual(self.deliver('anna'), [self.message('second')])
+        self.assertEqual(os.path.getsize(self.database.spool.name), 0)
+
+    def test_compact(self):
+        """Доставленные сообщения вырезаются из спула, даже если другой пользователь не входит"""
+        self.database.store_offline_message('anna', self.message('first'))
+        for number in range(3):
+            self.database.store_offline_message('boris', self.message('x' * 500000))
+        self.database.store_offline_message('anna', self.message('second'))
+        self.assertEqual(len(self.deliver('boris')), 3)
+        self.assertEqual(self.database.spool_generation, 1)
+        self.assertLess(os.path.getsize(self.database.spool.name), 1000)
+        self.assertFalse(os.path.exists(f'{self.path}.spool'))
+
+        self.database.store_offline_message('anna', self.message('third'))
+        self.database.close()
+        self.database = ServerDB(self.path)
+        self.assertEqual([message['message'] for message in self.deliver('anna')],
+                         ['first', 'second', 'third'])
+
+    def test_stale_spool(self):
+        """Файл спула, оставшийся от прерванного сжатия, удаляется при запуске"""
+        self.database.store_offline_message('anna', self.message('first'))
+        self.database.close()
+        with open(f'{self.path}.spool.1', 'wb') as stale:
+            stale.write(b'garbage')
+        self.database = ServerDB(self.path)
+        self.assertFalse(os.path.exists(f'{self.path}.spool.1'))
+        self.assertEqual(self.deliver('anna'), [self.message('first')])
+
+
+class TestClassCreateStorage(unittest.TestCase):
+    """Тестирование выбора хранилища по настройкам"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = configparser.ConfigParser()
+        self.config['SETTINGS'] = {'database_path': self.directory.name,
+                                   'database_file': 'server.db3'}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_file(self):
+        """Без DSN используется файл SQLite"""
+        database = create_storage(self.config['SETTINGS'])
+        self.assertEqual(type(database).__name__, 'ServerDB')
+        database.close()
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'server.db3')))
+
+    def test_dsn(self):
+        """С DSN используется хранилище с пулом соединений"""
+        self.config['SETTINGS']['database_dsn'] = f'sqlite:///{self.directory.name}/dsn.db3'
+        database = create_storage(self.config['SETTINGS'])
+        self.assertEqual(type(database).__name__, 'PooledServerDB')
+        database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
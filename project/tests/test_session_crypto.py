@@ -0,0 +1,40 @@
+import unittest
+from Cryptodome.Cipher import PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+from project.client.session_crypto import SessionEncryptor, SessionDecryptor
+
+
+class TestClassSessionCrypto(unittest.TestCase):
+    """Тестирование гибридного шифрования сообщений"""
+
+    keys = RSA.generate(2048)
+
+    def setUp(self):
+        self.encryptor = SessionEncryptor(self.keys.publickey(), rekey_after=3)
+        self.decryptor = SessionDecryptor(self.keys)
+
+    def test_round_trip(self):
+        """Длинное сообщение шифруется и расшифровывается"""
+        text = 'Привет! ' * 1000
+        self.assertEqual(self.decryptor.decrypt(self.encryptor.encrypt(text.encode('utf8'))).decode('utf8'), text)
+
+    def test_session_key_cached(self):
+        """Сеансовый ключ разворачивается один раз на сеанс, после rekey_after - новый"""
+        for number in range(6):
+            self.assertEqual(self.decryptor.decrypt(self.encryptor.encrypt(b'%d' % number)), b'%d' % number)
+        self.assertEqual(len(self.decryptor.sessions), 2)
+
+    def test_legacy_rsa(self):
+        """Сообщение старого формата (только RSA) расшифровывается"""
+        data = PKCS1_OAEP.new(self.keys.publickey()).encrypt(b'legacy')
+        self.assertEqual(self.decryptor.decrypt(data), b'legacy')
+
+    def test_tampered(self):
+        """Изменённое сообщение отвергается"""
+        data = bytearray(self.encryptor.encrypt(b'text'))
+        data[-1] ^= 1
+        self.assertRaises(ValueError, self.decryptor.decrypt, bytes(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import queue
+import socket
+import time
+import unittest
+from PyQt5.QtCore import Qt
+from project.constants import *
+from project.utils import get_message, send_message
+from project.client.transport import ClientTransport
+
+
+class LoopbackTransport(ClientTransport):
+    """Транспорт клиента, подключённый к концу socketpair вместо сервера"""
+
+    def connection_init(self):
+        self.transport, self.server = socket.socketpair()
+        self.transport.settimeout(0.5)
+        self.server.settimeout(5)
+
+    def user_list_request(self):
+        pass
+
+    def contacts_list_request(self):
+        pass
+
+    def public_keys_check(self):
+        pass
+
+
+class TestClassTransport(unittest.TestCase):
+    """Тестирование сопоставления запросов и ответов в транспорте клиента"""
+
+    def setUp(self):
+        self.transport = LoopbackTransport('127.0.0.1', DEFAULT_PORT, 'user1', None, 'password', None)
+        self.transport.daemon = True
+        self.transport.start()
+
+    def tearDown(self):
+        self.transport.running = False
+        self.transport.server.close()
+        self.transport.join(5)
+        self.transport.transport.close()
+
+    def request(self):
+        return {ACTION: GET_CONTACTS, TIME: time.time(), USER: 'user1'}
+
+    def test_timeout_forgets_request(self):
+        """Запрос без ответа снимается по таймауту и не сдвигает следующие ответы"""
+        self.assertRaises(TimeoutError, self.transport.send_request, self.request())
+        self.assertEqual(self.transport.requests, {})
+        self.assertEqual(len(self.transport.requests_order), 0)
+        get_message(self.transport.server)
+
+        future = self.transport.submit_request(self.request())
+        get_message(self.transport.server)
+        send_message(self.transport.server, {RESPONSE: 202, ALERT: ['user2']})
+        self.assertEqual(self.transport.wait_reply(future), {RESPONSE: 202, ALERT: ['user2']})
+
+    def test_reply_by_request_id(self):
+        """Ответы сопоставляются запросам по REQUEST_ID в любом порядке"""
+        first = self.transport.submit_request(self.request())
+        second = self.transport.submit_request(self.request())
+        ids = [get_message(self.transport.server)[REQUEST_ID] for _ in range(2)]
+        send_message(self.transport.server, {RESPONSE: 202, ALERT: ['second'], REQUEST_ID: ids[1]})
+        send_message(self.transport.server, {RESPONSE: 202, ALERT: ['first'], REQUEST_ID: ids[0]})
+        self.assertEqual(self.transport.wait_reply(first)[ALERT], ['first'])
+        self.assertEqual(self.transport.wait_reply(second)[ALERT], ['second'])
+
+    def test_push_between_replies(self):
+        """Входящие сообщения обрабатываются приёмником, ответ достаётся запросу"""
+        received = queue.Queue()
+        self.transport.new_message.connect(received.put, Qt.DirectConnection)
+        self.transport.public_key_changed.connect(lambda user, key: received.put((user, key)),
+                                                  Qt.DirectConnection)
+        future = self.transport.submit_request(self.request())
+        request_id = get_message(self.transport.server)[REQUEST_ID]
+        push = {ACTION: MESSAGE, TIME: time.time(), FROM: 'user2', TO: 'user1', MESSAGE_TEXT: 'text'}
+        send_message(self.transport.server, push)
+        send_message(self.transport.server, {ACTION: PUBLIC_KEY_UPDATE, TIME: time.time(),
+                                             ACCOUNT_NAME: 'user2', PUBLIC_KEY: 'key'})
+        send_message(self.transport.server, {RESPONSE: 202, ALERT: [], REQUEST_ID: request_id})
+        self.assertEqual(self.transport.wait_reply(future), {RESPONSE: 202, ALERT: [], REQUEST_ID: request_id})
+        self.assertEqual(received.get(timeout=5), push)
+        self.assertEqual(received.get(timeout=5), ('user2', 'key'))
+
+    def test_connection_lost(self):
+        """При обрыве соединения ожидающие запросы завершаются ошибкой"""
+        lost = queue.Queue()
+        self.transport.connection_lost.connect(lambda: lost.put(True), Qt.DirectConnection)
+        future = self.transport.submit_request(self.request())
+        self.transport.server.close()
+        self.assertRaises(ConnectionResetError, self.transport.wait_reply, future)
+        self.assertTrue(lost.get(timeout=5))
+        self.assertRaises(ConnectionResetError, self.transport.submit_request, self.request())
+
+
+if __name__ == '__main__':
+    unittest.main()
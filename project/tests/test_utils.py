@@ -1,11 +1,12 @@
 import sys
 import os
 import json
+import struct
 import unittest
 from socket import socket, AF_INET, SOCK_STREAM
 from project.constants import *
 sys.path.append(os.path.join(os.getcwd(), '..'))
-from project.utils import get_message, send_message
+from project.utils import get_message, send_message, MessageFramer, CompactCodec, JsonCodec, select_codec, msgpack
 
 
 class TestClassUtils(unittest.TestCase):
@@ -54,5 +55,87 @@ class TestClassUtils(unittest.TestCase):
         self.assertRaises(OSError, send_message, self.client, message)
 
 
+class TestClassMessageFramer(unittest.TestCase):
+    """Тестирование сборки сообщений из потока байт"""
+
+    def setUp(self):
+        self.framer = MessageFramer()
+
+    def test_coalesced_frames(self):
+        """Два кадра, пришедшие одним чтением, дают два сообщения"""
+        data = self.framer.pack({'response': 200}) + self.framer.pack({'response': 202})
+        self.framer.feed(data)
+        self.assertEqual([self.framer.pop(), self.framer.pop()], [{'response': 200}, {'response': 202}])
+
+    def test_split_frame(self):
+        """Кадр, разрезанный на части, собирается после последней части"""
+        data = self.framer.pack({'action': 'presence', 'time': 1.1})
+        self.framer.feed(data[:3])
+        self.framer.feed(data[3:10])
+        self.assertFalse(self.framer.pending)
+        self.framer.feed(data[10:])
+        self.assertEqual(self.framer.pop(), {'action': 'presence', 'time': 1.1})
+        self.assertFalse(self.framer.buffer)
+
+    def test_legacy_mode(self):
+        """Старый клиент без заголовков получает ответы без заголовков"""
+        self.framer.feed(b'{"response": 200}{"resp')
+        self.assertTrue(self.framer.legacy)
+        self.framer.feed(b'onse": 202}')
+        self.assertEqual([self.framer.pop(), self.framer.pop()], [{'response': 200}, {'response': 202}])
+        self.assertEqual(self.framer.pack({'response': 200}), b'{"response": 200}')
+
+    def test_frame_too_long(self):
+        """Кадр длиннее MAX_PACKAGES_LENGTH отвергается"""
+        self.assertRaises(Exception, self.framer.feed, struct.pack('>I', MAX_PACKAGES_LENGTH + 1))
+
+    @unittest.skipIf(msgpack is None, 'нужен пакет msgpack')
+    def test_codec_switch(self):
+        """Кадры после ответа с выбором кодека декодируются новым кодеком"""
+        data = self.framer.pack({RESPONSE: 200, CODEC: 'compact'})
+        self.framer.codec = CompactCodec()
+        data += self.framer.pack({ACTION: MESSAGE, MESSAGE_TEXT: b'\x00\xff'})
+        reader = MessageFramer()
+        reader.feed(data)
+        self.assertEqual(reader.pop(), {RESPONSE: 200, CODEC: 'compact'})
+        reader.codec = CompactCodec()
+        self.assertEqual(reader.pop(), {ACTION: MESSAGE, MESSAGE_TEXT: b'\x00\xff'})
+
+
+class TestClassCodecs(unittest.TestCase):
+    """Тестирование кодеков сообщений"""
+
+    message = {ACTION: MESSAGE, TIME: 1700000000.25, FROM: 'test1', TO: 'test2',
+               MESSAGE_TEXT: bytes(range(256)), 'extra': [None, True, -1, -200, 70000, 2 ** 40, 'й' * 40]}
+
+    @unittest.skipIf(msgpack is None, 'нужен пакет msgpack')
+    def test_compact_round_trip(self):
+        """Сообщение, в том числе с неизвестным ключом, восстанавливается без изменений"""
+        codec = CompactCodec()
+        self.assertEqual(codec.decode(codec.encode(self.message)), self.message)
+
+    @unittest.skipIf(msgpack is None, 'нужен пакет msgpack')
+    def test_compact_is_smaller(self):
+        """Компактный кодек короче JSON с шифротекстом в base64"""
+        self.assertLess(len(CompactCodec().encode(self.message)), len(JsonCodec().encode(self.message)) * 0.75)
+
+    def test_json_bytes_as_base64(self):
+        """JSON передаёт байты строкой base64"""
+        decoded = JsonCodec().decode(JsonCodec().encode({MESSAGE_TEXT: b'\x00\x01'}))
+        self.assertEqual(decoded, {MESSAGE_TEXT: 'AAE='})
+
+    @unittest.skipIf(msgpack is None, 'нужен пакет msgpack')
+    def test_compact_malformed(self):
+        """Обрезанные данные отвергаются"""
+        data = CompactCodec().encode(self.message)
+        self.assertRaises(Exception, CompactCodec().decode, data[:-5])
+
+    def test_select_codec(self):
+        """Выбирается предпочтительный из предложенных кодеков, по умолчанию JSON"""
+        self.assertEqual(select_codec(['json', 'compact']).name, 'compact' if msgpack else 'json')
+        self.assertEqual(select_codec(['compact']).name, 'compact' if msgpack else 'json')
+        self.assertEqual(select_codec(['cbor']).name, 'json')
+
+
 if __name__ == '__main__':
     unittest.main()
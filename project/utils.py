@@ -1,37 +1,256 @@
+import base64
+import errno
+import hashlib
 import json
+import struct
 import sys
 import logging
+import weakref
+from collections import deque
+from Cryptodome.PublicKey import RSA
 from constants import *
+from errors import IncorrectDataRecivedError
 from logs.decos import log
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 if 'server' in sys.argv[0]:
     logger = logging.getLogger('server')
 else:
     logger = logging.getLogger('client')
 
+FRAME_HEADER = struct.Struct('>I')
 
-@log
-def get_message(client):
-    """Get and decode message"""
-    encode_response = client.recv(MAX_PACKAGES_LENGTH)
-    if isinstance(encode_response, bytes):
-        decode_response = encode_response.decode(ENCODING)
-        response = json.loads(decode_response)
-        if isinstance(response, dict):
-            return response
+# Wire numbers of protocol keys in the compact codec. The position in the
+# tuple is the key number, so new keys may only be appended.
+COMPACT_KEYS = (ACTION, TIME, USER, ACCOUNT_NAME, PUBLIC_KEY, FROM, TO,
+                RESPONSE, ALERT, ERROR, MESSAGE_TEXT, CONTACT, CODECS, CODEC, REQUEST_ID,
+                USERS_VERSION, REMOVED)
+_KEY_NUMBERS = {key: number for number, key in enumerate(COMPACT_KEYS)}
+
+
+class JsonCodec:
+    """
+    JIM messages as UTF-8 JSON, the protocol default.
+
+    JSON has no binary type, so bytes values (ciphertext) are sent as
+    base64 strings.
+    """
+    name = 'json'
+
+    @staticmethod
+    def _default(value):
+        if isinstance(value, (bytes, bytearray)):
+            return base64.b64encode(value).decode('ascii')
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+    def encode(self, msg):
+        return json.dumps(msg, default=self._default).encode(ENCODING)
+
+    def decode(self, data):
+        return json.loads(bytes(data).decode(ENCODING))
+
+
+class CompactCodec:
+    """
+    JIM messages in MessagePack format with integer protocol keys.
+
+    Keys listed in COMPACT_KEYS are replaced by their numbers, any other
+    key is sent as a string. Bytes values travel as raw binary. Requires
+    the msgpack package; without it only json is offered and accepted.
+    """
+    name = 'compact'
+
+    def encode(self, msg):
+        return msgpack.packb(self._number_keys(msg), use_bin_type=True)
+
+    def decode(self, data):
+        try:
+            return self._name_keys(msgpack.unpackb(data, raw=False, strict_map_key=False))
+        except (ValueError, IndexError, KeyError, TypeError):
+            raise IncorrectDataRecivedError
+
+    def _number_keys(self, value):
+        if isinstance(value, dict):
+            return {_KEY_NUMBERS.get(key, key): self._number_keys(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._number_keys(item) for item in value]
+        return value
+
+    def _name_keys(self, value):
+        if isinstance(value, dict):
+            return {COMPACT_KEYS[key] if isinstance(key, int) else key: self._name_keys(item)
+                    for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._name_keys(item) for item in value]
+        return value
+
+
+JSON_CODEC = JsonCodec()
+
+# Codecs this side supports, in order of preference. The client advertises
+# the names in PRESENCE, the server picks one of them.
+AVAILABLE_CODECS = {codec.name: codec for codec in (CompactCodec(), JSON_CODEC)
+                    if codec is JSON_CODEC or msgpack is not None}
+
+
+def key_fingerprint(pub_key):
+    """Fingerprint of a public key as stored and sent (PEM text)."""
+    return hashlib.sha256(pub_key.encode('ascii')).hexdigest()
+
+
+def valid_public_key(pub_key):
+    """Whether pub_key is an RSA public key that RSA.import_key accepts."""
+    try:
+        RSA.import_key(pub_key)
+    except (ValueError, IndexError, TypeError):
+        return False
+    return True
+
+
+def select_codec(names):
+    """Pick the preferred codec among those offered by the peer."""
+    for name, codec in AVAILABLE_CODECS.items():
+        if name in names:
+            return codec
+    return JSON_CODEC
+
+
+_framers = weakref.WeakKeyDictionary()
+
+
+class MessageFramer:
+    """
+    Incremental reassembly buffer of one connection.
+
+    Every message is sent as a frame: 4-byte big-endian body length and
+    the JSON body. The length never exceeds MAX_PACKAGES_LENGTH, so the
+    first byte of a frame is always zero. A peer whose first byte is not
+    zero is an old client sending bare JSON; such a connection is switched
+    to legacy mode and is answered without frame headers.
+
+    Frame bodies are decoded by codec only when popped, so a codec switched
+    after the handshake reply also applies to frames received in the same
+    read as the reply.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.legacy = None
+        self.codec = JSON_CODEC
+
+    def feed(self, data):
+        """Append received bytes and queue every completed message."""
+        self.buffer += data
+        if self.legacy is None and self.buffer:
+            self.legacy = self.buffer[0] != 0
+            if self.legacy:
+                logger.debug('Соединение переведено в режим совместимости (JSON без заголовков)')
+        if self.legacy:
+            self._split_legacy()
         else:
+            self._split_frames()
+
+    def _split_frames(self):
+        buffer = self.buffer
+        start = 0
+        while len(buffer) - start >= FRAME_HEADER.size:
+            length, = FRAME_HEADER.unpack_from(buffer, start)
+            if length > MAX_PACKAGES_LENGTH:
+                raise IncorrectDataRecivedError
+            end = start + FRAME_HEADER.size + length
+            if len(buffer) < end:
+                break
+            self.pending.append(bytes(buffer[start + FRAME_HEADER.size:end]))
+            start = end
+        del buffer[:start]
+
+    def _split_legacy(self):
+        try:
+            text = self.buffer.decode(ENCODING)
+        except UnicodeDecodeError as err:
+            if err.reason != 'unexpected end of data':
+                raise
+            text = self.buffer[:err.start].decode(ENCODING)
+        decoder = json.JSONDecoder()
+        position = 0
+        while True:
+            while position < len(text) and text[position].isspace():
+                position += 1
+            if position == len(text):
+                break
+            try:
+                message, position = decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                if len(self.buffer) > MAX_PACKAGES_LENGTH:
+                    raise
+                break
+            self.pending.append(message)
+        del self.buffer[:len(text[:position].encode(ENCODING))]
+
+    def pop(self):
+        """Return the oldest completed message."""
+        message = self.pending.popleft()
+        if not self.legacy:
+            message = self.codec.decode(message)
+        if not isinstance(message, dict):
             raise ValueError
-    else:
+        return message
+
+    def pack(self, msg):
+        """Encode a message in the mode of this connection."""
+        codec = JSON_CODEC if self.legacy else self.codec
+        try:
+            body = codec.encode(msg)
+        except (TypeError, ValueError, OverflowError):
+            logger.critical(f'Сообщение: {msg} не удалось'
+                            f' преобразовать кодеком {codec.name}')
+            raise
+        if self.legacy:
+            return body
+        return FRAME_HEADER.pack(len(body)) + body
+
+
+def get_framer(client):
+    """Return the reassembly buffer bound to the socket."""
+    framer = _framers.get(client)
+    if framer is None:
+        framer = _framers.setdefault(client, MessageFramer())
+    return framer
+
+
+def _receive(client, framer):
+    data = client.recv(RECV_BUFFER_SIZE)
+    if not isinstance(data, bytes):
         raise ValueError
+    if not data:
+        raise ConnectionResetError(errno.ECONNRESET, 'Соединение закрыто удалённым компьютером')
+    framer.feed(data)
+
+
+@log
+def get_message(client):
+    """Get and decode message"""
+    framer = get_framer(client)
+    while not framer.pending:
+        _receive(client, framer)
+    return framer.pop()
+
+
+@log
+def read_messages(client):
+    """Read the socket once and return every completed message."""
+    framer = get_framer(client)
+    if not framer.pending:
+        _receive(client, framer)
+    return [framer.pop() for _ in range(len(framer.pending))]
 
 
 @log
 def send_message(client, msg):
     """Encode and send message."""
-    try:
-        json_response = json.dumps(msg)
-    except json.JSONDecodeError:
-        logger.critical(f'Сообщение: {msg} не удалось'
-                        f' преобразовать в JSON строку')
-    encode_response = json_response.encode(ENCODING)
-    client.send(encode_response)
+    client.sendall(get_framer(client).pack(msg))